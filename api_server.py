@@ -0,0 +1,180 @@
+"""
+Headless JSON API for the knowledge assistant.
+
+Exposes the same endpoint integration as the Streamlit app without the UI:
+
+    POST /v1/chat          blocking answer, or server-sent events with "stream": true
+    POST /v1/chat/batch    several independent conversations in one request
+    GET  /v1/metrics       endpoint latency and usage metrics for this worker
+    GET  /healthz          liveness check
+
+Run locally with `python api_server.py`, or deploy with app-api.yaml.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from model_serving_utils import (
+    query_endpoint, query_endpoint_stream, is_endpoint_supported, classify_error, estimate_usage,
+    EndpointRateLimitedError, EndpointTimeoutError, EndpointUnavailableError,
+)
+from output_budget import choose_max_tokens
+from metrics import endpoint_metrics
+from usage_store import usage_store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SERVING_ENDPOINT = os.getenv('SERVING_ENDPOINT')
+assert SERVING_ENDPOINT, \
+    ("Unable to determine serving endpoint to use for the API. Set the SERVING_ENDPOINT "
+     "environment variable to the name of your serving endpoint.")
+
+# Maximum conversations answered concurrently within one batch request
+API_BATCH_CONCURRENCY = int(os.getenv('API_BATCH_CONCURRENCY', '8'))
+API_MAX_BATCH_SIZE = int(os.getenv('API_MAX_BATCH_SIZE', '32'))
+RESPONSE_DEADLINE_S = float(os.getenv('RESPONSE_DEADLINE_S', '60'))
+
+
+class Message(BaseModel):
+    role: str = "user"
+    content: str
+
+
+class ChatRequest(BaseModel):
+    messages: list[Message] = Field(..., min_length=1)
+    max_tokens: Optional[int] = Field(None, gt=0)
+    stream: bool = False
+
+
+class BatchRequest(BaseModel):
+    requests: list[ChatRequest] = Field(..., min_length=1)
+
+
+app = FastAPI(title="Knowledge Assistant API")
+
+
+def _max_tokens(request: ChatRequest) -> int:
+    return request.max_tokens or choose_max_tokens(request.messages[-1].content)
+
+
+def _answer(request: ChatRequest, user_id: str = None) -> dict:
+    message = query_endpoint(
+        endpoint_name=SERVING_ENDPOINT,
+        messages=[m.model_dump() for m in request.messages],
+        max_tokens=_max_tokens(request),
+    )
+    if message.get("usage"):
+        usage_store.record(message["usage"], user_id=user_id)
+    return {
+        "message": {"role": "assistant", "content": message["content"]},
+        "fallback_stage": message.get("fallback_stage"),
+    }
+
+
+def _http_error(error: Exception) -> HTTPException:
+    """Translate an endpoint error into the HTTP error returned to API clients."""
+    error = classify_error(error)
+    if isinstance(error, EndpointRateLimitedError):
+        headers = {"Retry-After": str(int(error.retry_after))} if error.retry_after else None
+        return HTTPException(status_code=429, detail=str(error), headers=headers)
+    if isinstance(error, EndpointTimeoutError):
+        return HTTPException(status_code=504, detail=str(error))
+    if isinstance(error, EndpointUnavailableError):
+        return HTTPException(status_code=503, detail=str(error))
+    return HTTPException(status_code=502, detail=str(error))
+
+
+def _sse_events(request: ChatRequest, user_id: str = None):
+    messages = [m.model_dump() for m in request.messages]
+    deltas = []
+    try:
+        for delta in query_endpoint_stream(
+            endpoint_name=SERVING_ENDPOINT,
+            messages=messages,
+            max_tokens=_max_tokens(request),
+            deadline_s=RESPONSE_DEADLINE_S,
+        ):
+            deltas.append(delta)
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+    except Exception as e:
+        logger.error(f"Error streaming from endpoint: {e}")
+        error = _http_error(e)
+        yield f"event: error\ndata: {json.dumps({'error': error.detail, 'status': error.status_code})}\n\n"
+        return
+    finally:
+        # Streams report no usage fields; record an estimate for whatever was sent,
+        # including streams cut short by an error or a client disconnect
+        if deltas:
+            usage_store.record(estimate_usage(messages, "".join(deltas)), user_id=user_id)
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "endpoint": SERVING_ENDPOINT}
+
+
+@app.get("/v1/metrics")
+def metrics():
+    # Metrics are per worker process
+    return {
+        "pid": os.getpid(),
+        "endpoint": endpoint_metrics.snapshot(),
+        "usage": usage_store.snapshot(),
+    }
+
+
+@app.post("/v1/chat")
+async def chat(request: ChatRequest, http_request: Request):
+    if request.stream:
+        # Sync generators are iterated in the threadpool, so blocking reads don't stall the loop
+        return StreamingResponse(
+            _sse_events(request, http_request.headers.get("X-Forwarded-User")),
+            media_type="text/event-stream",
+        )
+    try:
+        return await run_in_threadpool(_answer, request, http_request.headers.get("X-Forwarded-User"))
+    except Exception as e:
+        logger.error(f"Error querying endpoint: {e}")
+        raise _http_error(e)
+
+
+@app.post("/v1/chat/batch")
+async def chat_batch(batch: BatchRequest, http_request: Request):
+    if len(batch.requests) > API_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size is limited to {API_MAX_BATCH_SIZE}")
+    semaphore = asyncio.Semaphore(API_BATCH_CONCURRENCY)
+    user_id = http_request.headers.get("X-Forwarded-User")
+
+    async def answer_one(request: ChatRequest) -> dict:
+        async with semaphore:
+            try:
+                return await run_in_threadpool(_answer, request, user_id)
+            except Exception as e:
+                logger.error(f"Error querying endpoint: {e}")
+                error = _http_error(e)
+                return {"error": error.detail, "status": error.status_code}
+
+    results = await asyncio.gather(*(answer_one(request) for request in batch.requests))
+    return {"results": results}
+
+
+if __name__ == "__main__":
+    if not is_endpoint_supported(SERVING_ENDPOINT):
+        logger.warning(f"Endpoint {SERVING_ENDPOINT} does not report a supported task type")
+    uvicorn.run(
+        "api_server:app",
+        host="0.0.0.0",
+        port=int(os.getenv('DATABRICKS_APP_PORT', '8000')),
+        workers=int(os.getenv('API_WORKERS', '4')),
+    )
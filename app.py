@@ -1,8 +1,24 @@
 import logging
 import os
 import streamlit as st
-from model_serving_utils import query_endpoint, is_endpoint_supported
+from model_serving_utils import (
+    query_endpoint, query_endpoint_stream, is_endpoint_supported, estimate_usage,
+    EndpointAuthError, EndpointSchemaError, EndpointRateLimitedError, EndpointTimeoutError,
+    EndpointUnavailableError,
+)
+from output_budget import choose_max_tokens, endpoint_latency, SLOW_LATENCY_MS
+from prefetch import FollowUpMiner, SpeculativePrefetcher
+from question_cache import NearDuplicateIndex
+from request_log import RequestLogWriter
+from profiling import maybe_profile, is_profiling_admin
+from metrics import endpoint_metrics
+from usage_store import usage_store
+from keep_warm import (
+    KeepWarmScheduler, KEEP_WARM_ENABLED, KEEP_WARM_ACTIVE_HOURS, KEEP_WARM_IDLE_S,
+    KEEP_WARM_CHECK_INTERVAL_S, parse_active_hours,
+)
 import time
+import uuid
 from datetime import datetime
 
 # Set up logging
@@ -21,6 +37,86 @@ assert SERVING_ENDPOINT, \
 # Check if the endpoint is supported
 endpoint_supported = is_endpoint_supported(SERVING_ENDPOINT)
 
+# Stream answers as they are generated, stopping at the token budget or deadline
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() == 'true'
+RESPONSE_DEADLINE_S = float(os.getenv('RESPONSE_DEADLINE_S', '60'))
+
+# Near-duplicate cache for first-turn questions (shared across sessions)
+NEAR_DUPLICATE_CACHE_ENABLED = os.getenv('NEAR_DUPLICATE_CACHE_ENABLED', 'false').lower() == 'true'
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', '1000'))
+NEAR_DUPLICATE_TTL_S = float(os.getenv('NEAR_DUPLICATE_TTL_S', '3600'))
+
+@st.cache_resource
+def get_question_cache():
+    return NearDuplicateIndex(
+        threshold=NEAR_DUPLICATE_THRESHOLD,
+        max_entries=NEAR_DUPLICATE_MAX_ENTRIES,
+        ttl_s=NEAR_DUPLICATE_TTL_S,
+    )
+
+# Optional request/response log for replay and analysis (disabled unless a path is set)
+REQUEST_LOG_PATH = os.getenv('REQUEST_LOG_PATH')
+
+@st.cache_resource
+def get_request_log():
+    return RequestLogWriter(
+        REQUEST_LOG_PATH,
+        max_bytes=int(os.getenv('REQUEST_LOG_MAX_BYTES', str(50 * 1024 * 1024))),
+        backup_count=int(os.getenv('REQUEST_LOG_BACKUP_COUNT', '10')),
+    )
+
+# Suggest likely follow-up questions and pre-generate their answers in the background
+SPECULATIVE_PREFETCH_ENABLED = os.getenv('SPECULATIVE_PREFETCH_ENABLED', 'false').lower() == 'true'
+SPECULATION_TOP_N = int(os.getenv('SPECULATION_TOP_N', '2'))
+SPECULATION_BUDGET_PER_SESSION = int(os.getenv('SPECULATION_BUDGET_PER_SESSION', '10'))
+SPECULATION_WORKERS = int(os.getenv('SPECULATION_WORKERS', '1'))
+# A follow-up is only suggested after this many asks from this many distinct sessions
+SPECULATION_MIN_COUNT = int(os.getenv('SPECULATION_MIN_COUNT', '3'))
+SPECULATION_MIN_SESSIONS = int(os.getenv('SPECULATION_MIN_SESSIONS', '2'))
+
+@st.cache_resource
+def get_follow_up_miner():
+    miner = FollowUpMiner(min_count=SPECULATION_MIN_COUNT, min_sessions=SPECULATION_MIN_SESSIONS)
+    if REQUEST_LOG_PATH and os.path.exists(REQUEST_LOG_PATH):
+        try:
+            pairs = miner.load_request_log(REQUEST_LOG_PATH)
+            logger.info(f"Mined {pairs} follow-up pairs from {REQUEST_LOG_PATH}")
+        except Exception as e:
+            # A damaged log only costs the mined suggestions, not the chat
+            logger.error(f"Could not mine follow-ups from {REQUEST_LOG_PATH}: {e}")
+    return miner
+
+def _speculative_answer(messages, usage_session_id=None, user_id=None):
+    response_message = query_endpoint(
+        endpoint_name=SERVING_ENDPOINT,
+        messages=messages,
+        max_tokens=choose_max_tokens(messages[-1]["content"]),
+        speculative=True,
+    )
+    if response_message.get("usage"):
+        # Speculation costs tokens whether or not it is used
+        usage_store.record(response_message["usage"], session_id=usage_session_id, user_id=user_id)
+    return response_message
+
+@st.cache_resource
+def get_prefetcher():
+    return SpeculativePrefetcher(
+        _speculative_answer,
+        max_workers=SPECULATION_WORKERS,
+        budget_per_session=SPECULATION_BUDGET_PER_SESSION,
+    )
+
+@st.cache_resource
+def start_keep_warm():
+    # One scheduler per app process, shared by all sessions
+    return KeepWarmScheduler(
+        SERVING_ENDPOINT,
+        active_hours=parse_active_hours(KEEP_WARM_ACTIVE_HOURS),
+        idle_s=KEEP_WARM_IDLE_S,
+        check_interval_s=KEEP_WARM_CHECK_INTERVAL_S,
+    ).start()
+
 def get_user_info():
     headers = st.context.headers
     return dict(
@@ -280,6 +376,16 @@ def handle_chat_interaction():
         prompt = st.chat_input("Ask me about NFL or MLB rules... 🏈⚾", key="main_chat_input")
     
     if prompt:
+        history = list(st.session_state.messages)
+        st.session_state.follow_ups = []
+
+        if SPECULATIVE_PREFETCH_ENABLED:
+            previous_questions = [m["content"] for m in history if m["role"] == "user"]
+            if previous_questions:
+                get_follow_up_miner().observe(
+                    previous_questions[-1], prompt, session_id=st.session_state.session_id,
+                )
+
         # Add user message to chat history
         st.session_state.messages.append({"role": "user", "content": prompt})
         
@@ -287,43 +393,151 @@ def handle_chat_interaction():
         with st.chat_message("user"):
             st.markdown(prompt)
 
+        # Only single-turn questions are safe to answer from the near-duplicate cache
+        is_first_turn = len(st.session_state.messages) == 1
+        question_cache = get_question_cache() if NEAR_DUPLICATE_CACHE_ENABLED else None
+        cached_match = question_cache.lookup(prompt) if question_cache and is_first_turn else None
+
+        started_at = time.time()
+        fallback_stage = None
+        error_msg = None
+        usage = None
+
         # Display assistant response with loading state
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing rules and regulations..."):
-                try:
-                    # Query the Databricks serving endpoint
-                    assistant_response = query_endpoint(
-                        endpoint_name=SERVING_ENDPOINT,
-                        messages=st.session_state.messages,
-                        max_tokens=512,  # Reduced for better response times
-                    )["content"]
-                    
-                    # Display response with typing effect
-                    st.markdown(assistant_response)
+            # Claim a pre-generated answer if this is a suggested follow-up
+            speculated = None
+            if SPECULATIVE_PREFETCH_ENABLED and not cached_match:
+                with st.spinner("Analyzing rules and regulations..."):
+                    speculated = get_prefetcher().take(
+                        st.session_state.session_id, history, prompt, timeout=RESPONSE_DEADLINE_S
+                    )
+
+            if cached_match:
+                fallback_stage = "near_duplicate_cache"
+                logger.info(
+                    f"Near-duplicate cache hit ({cached_match['similarity']:.2f}): "
+                    f"{prompt!r} -> {cached_match['question']!r}"
+                )
+                assistant_response = cached_match["answer"]
+                st.markdown(assistant_response)
+                # The matched question may be another user's wording, so it isn't shown
+                st.caption("⚡ Answered from a similar earlier question")
+            elif speculated:
+                fallback_stage = "speculative_prefetch"
+                assistant_response = speculated["content"]
+                st.markdown(assistant_response)
+            else:
+                with st.spinner("Analyzing rules and regulations..."):
+                    try:
+                        # Budget output tokens by question type and current endpoint latency
+                        max_tokens = choose_max_tokens(prompt)
+
+                        if STREAM_RESPONSES:
+                            # Display response with typing effect
+                            stream_info = {}
+                            assistant_response = st.write_stream(query_endpoint_stream(
+                                endpoint_name=SERVING_ENDPOINT,
+                                messages=st.session_state.messages,
+                                max_tokens=max_tokens,
+                                deadline_s=RESPONSE_DEADLINE_S,
+                                stream_info=stream_info,
+                            ))
+                            fallback_stage = stream_info.get("fallback_stage")
+                            truncated = stream_info.get("truncated", False)
+                            usage = estimate_usage(st.session_state.messages, assistant_response)
+                        else:
+                            # Query the Databricks serving endpoint
+                            response_message = query_endpoint(
+                                endpoint_name=SERVING_ENDPOINT,
+                                messages=st.session_state.messages,
+                                max_tokens=max_tokens,
+                            )
+                            assistant_response = response_message["content"]
+                            fallback_stage = response_message.get("fallback_stage")
+                            truncated = response_message.get("truncated", False)
+                            usage = response_message.get("usage")
+                            st.markdown(assistant_response)
+
+                        if usage:
+                            usage_store.record(
+                                usage,
+                                session_id=st.session_state.session_id,
+                                user_id=get_user_info().get("user_id"),
+                            )
+
+                        # Answers cut off by the token budget or deadline aren't worth reusing
+                        if question_cache and is_first_turn and not truncated:
+                            question_cache.insert(prompt, assistant_response)
                     
-                except Exception as e:
-                    error_msg = str(e)
-                    logger.error(f"Error querying endpoint: {e}")
+                    except Exception as e:
+                        error_msg = str(e)
+                        logger.error(f"Error querying endpoint: {e}")
                     
-                    if "authentication" in error_msg.lower() or "token" in error_msg.lower():
-                        st.error("🔐 Authentication issue with the sports rules database.")
-                        st.info("📞 Please contact your administrator to check endpoint permissions.")
-                    elif "validation" in error_msg.lower() or "schema" in error_msg.lower():
-                        st.error("🔧 Data format issue when querying the sports rules database.")
-                        st.info("💡 **Try asking your question in a different way**, such as:\n- 'Explain NFL overtime rules'\n- 'What happens in NFL playoff overtime?'")
-                    elif "failed" in error_msg.lower() and "approaches" in error_msg.lower():
-                        st.error("⚠️ Multiple connection attempts to the sports rules database failed.")
-                        st.info(f"🔍 **Technical details:** {error_msg[:200]}...")
-                        st.info("🔄 Please try again in a moment, or contact support if the issue persists.")
-                    else:
-                        st.error("⚠️ I'm experiencing technical difficulties connecting to the sports rules database.")
-                        st.info("🔄 Please try again in a moment, or try asking a different question.")
+                        if isinstance(e, EndpointAuthError):
+                            st.error("🔐 Authentication issue with the sports rules database.")
+                            st.info("📞 Please contact your administrator to check endpoint permissions.")
+                        elif isinstance(e, EndpointSchemaError):
+                            st.error("🔧 Data format issue when querying the sports rules database.")
+                            st.info("💡 **Try asking your question in a different way**, such as:\n- 'Explain NFL overtime rules'\n- 'What happens in NFL playoff overtime?'")
+                        elif isinstance(e, EndpointRateLimitedError):
+                            st.error("🚦 The sports rules database is handling a lot of questions right now.")
+                            wait = f" in about {e.retry_after:.0f} seconds" if e.retry_after else " in a moment"
+                            st.info(f"🔄 Please try again{wait}.")
+                        elif isinstance(e, EndpointTimeoutError):
+                            st.error("⏱️ The sports rules database took too long to respond.")
+                            st.info("🔄 Please try again, or ask a shorter question.")
+                        elif isinstance(e, EndpointUnavailableError):
+                            st.error("⚠️ The sports rules database is unavailable right now.")
+                            st.info(f"🔍 **Technical details:** {error_msg[:200]}...")
+                            st.info("🔄 Please try again in a moment, or contact support if the issue persists.")
+                        else:
+                            st.error("⚠️ I'm experiencing technical difficulties connecting to the sports rules database.")
+                            st.info("🔄 Please try again in a moment, or try asking a different question.")
                     
-                    assistant_response = "I apologize for the technical issue. Please try rephrasing your question or try one of the example questions above."
+                        assistant_response = "I apologize for the technical issue. Please try rephrasing your question or try one of the example questions above."
+
+        if REQUEST_LOG_PATH:
+            get_request_log().log({
+                "endpoint": SERVING_ENDPOINT,
+                "session_id": st.session_state.session_id,
+                "user_id": get_user_info().get("user_id"),
+                "prompt": prompt,
+                "messages": list(st.session_state.messages),
+                "response": assistant_response,
+                "latency_ms": round((time.time() - started_at) * 1000, 1),
+                "fallback_stage": fallback_stage,
+                "usage": usage,
+                "error": error_msg,
+            })
 
         # Add assistant response to chat history
         st.session_state.messages.append({"role": "assistant", "content": assistant_response})
 
+        # Offer likely follow-ups and start answering them while the user reads
+        if SPECULATIVE_PREFETCH_ENABLED and error_msg is None:
+            follow_ups = get_follow_up_miner().top(prompt, n=SPECULATION_TOP_N)
+            st.session_state.follow_ups = follow_ups
+            # Don't add speculative load to an endpoint that is already slow
+            if follow_ups and (endpoint_latency.ewma_ms or 0) <= SLOW_LATENCY_MS:
+                get_prefetcher().speculate(
+                    st.session_state.session_id,
+                    list(st.session_state.messages),
+                    follow_ups,
+                    usage_session_id=st.session_state.session_id,
+                    user_id=get_user_info().get("user_id"),
+                )
+
+def display_follow_ups():
+    follow_ups = st.session_state.get("follow_ups")
+    if not follow_ups:
+        return
+    st.markdown("**💡 People often ask next:**")
+    for i, q in enumerate(follow_ups):
+        if st.button(q, key=f"follow_up_{i}", use_container_width=True):
+            st.session_state.selected_question = q
+            st.rerun()
+
 def main():
     # Page configuration
     st.set_page_config(
@@ -339,9 +553,14 @@ def main():
     # Initialize session state
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
     
     # Check user info
     user_info = get_user_info()
+
+    if KEEP_WARM_ENABLED and endpoint_supported:
+        start_keep_warm()
     
     # Main layout
     display_header()
@@ -366,7 +585,39 @@ def main():
         st.markdown(f"**User:** {user_info.get('user_name', 'Guest')}")
         st.markdown(f"**Time:** {datetime.now().strftime('%I:%M %p')}")
         st.markdown(f"**Messages:** {len(st.session_state.messages)}")
+
+        if NEAR_DUPLICATE_CACHE_ENABLED:
+            cache_stats = get_question_cache().stats()
+            with st.expander("⚡ Answer Cache"):
+                st.markdown(
+                    f"**Stored:** {cache_stats['entries']} · **Hits:** {cache_stats['hits']} · "
+                    f"**Misses:** {cache_stats['misses']}"
+                )
+                # The cache is shared by all sessions, so only admins see which questions matched
+                if is_profiling_admin(user_info.get("user_email")):
+                    for match in reversed(get_question_cache().audit_log()[-5:]):
+                        st.caption(f"{match['query']} → {match['matched_question']} ({match['similarity']:.2f})")
         
+        metrics = endpoint_metrics.snapshot()
+        with st.expander("📈 Endpoint Metrics"):
+            st.markdown(
+                f"**Requests:** {metrics['requests']} · **Errors:** {metrics['errors']}  \n"
+                f"**Warm p50/p95:** {metrics['warm_p50_ms']} / {metrics['warm_p95_ms']} ms  \n"
+                f"**Cold starts:** {metrics['cold_starts']} (p50 {metrics['cold_p50_ms']} ms)  \n"
+                f"**Keep-warm calls:** {metrics['warmups']} ({metrics['warmup_cold_starts']} cold)  \n"
+                f"**Speculative calls:** {metrics['speculative_calls']}"
+            )
+
+        session_usage = usage_store.session(st.session_state.session_id)
+        user_usage = usage_store.user(user_info.get("user_id"))
+        with st.expander("🧮 Usage"):
+            for label, totals in (("This chat", session_usage), ("You (all chats)", user_usage)):
+                st.markdown(
+                    f"**{label}:** {totals['calls']} calls · "
+                    f"{totals['input_tokens']:,} in / {totals['output_tokens']:,} out tokens · "
+                    f"{(totals['request_bytes'] + totals['response_bytes']) / 1024:,.0f} KB"
+                )
+
         st.markdown("---")
         st.markdown("### 🎯 What I Can Help With")
         st.markdown("""
@@ -381,6 +632,9 @@ def main():
         st.markdown("---")
         if st.button("🗑️ Clear Chat History", use_container_width=True):
             st.session_state.messages = []
+            st.session_state.follow_ups = []
+            if SPECULATIVE_PREFETCH_ENABLED:
+                get_prefetcher().evict(st.session_state.session_id)
             st.rerun()
     
     # Main chat interface
@@ -400,5 +654,19 @@ def main():
         # Chat interaction
         handle_chat_interaction()
 
+        # Suggested follow-up questions
+        display_follow_ups()
+
 if __name__ == "__main__":
-    main()
+    # Admins can force a profile of a single rerun with ?profile=1
+    force_profile = (
+        st.query_params.get("profile") == "1"
+        and is_profiling_admin(get_user_info().get("user_email"))
+    )
+    try:
+        with maybe_profile("rerun", force=force_profile):
+            main()
+    finally:
+        if force_profile:
+            # Profile only this rerun; the param would otherwise force every later rerun too
+            st.query_params.pop("profile", None)
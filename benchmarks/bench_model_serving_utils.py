@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the client-side overhead of model_serving_utils.
+
+The MLflow transport is replaced with an in-process stub, so these numbers
+measure only our own work: payload formatting, response-shape parsing,
+exception-driven fallback and the endpoint task-type checks.
+
+    python benchmarks/bench_model_serving_utils.py                     # compare to baseline
+    python benchmarks/bench_model_serving_utils.py --update-baseline   # record a new baseline
+
+Exits with status 1 when a case's time per call or allocations per call
+regress beyond the thresholds. Timings depend on the machine, so refresh the
+baseline when moving to different hardware.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_serving_utils  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ENDPOINT_NAME = "bench-endpoint"
+
+
+class StubDeployClient:
+    """Stands in for the MLflow deployments client, returning a prebuilt response."""
+
+    def __init__(self, response, fail_with_trace: bool = False):
+        self.response = response
+        self.fail_with_trace = fail_with_trace
+
+    def predict(self, endpoint, inputs):
+        if self.fail_with_trace and "databricks_options" in inputs:
+            raise Exception("400 Bad Request: unknown field databricks_options")
+        return self.response
+
+
+def _history(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"How does overtime work in NFL playoffs? Part {i}"})
+        messages.append({"role": "assistant", "content": "In the NFL playoffs, overtime periods are 10 minutes. " * 8})
+    messages.append({"role": "user", "content": "What about the regular season?"})
+    return messages
+
+
+def _output_response(trace_bytes: int = 0) -> dict:
+    response = {
+        "output": [{
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": "Overtime in the NFL playoffs is played until a winner is decided."}],
+        }],
+    }
+    if trace_bytes:
+        # Traces come back as many nested spans; approximate with a list of span dicts
+        span = {"name": "retriever", "attributes": {"document": "x" * 1000}}
+        response["databricks_output"] = {"trace": {"spans": [dict(span) for _ in range(trace_bytes // 1000)]}}
+    return response
+
+
+def _predictions_response() -> dict:
+    return {"predictions": [{"content": "A balk is an illegal motion by the pitcher."}]}
+
+
+def _query_case(messages, response, fail_with_trace=False):
+    client = StubDeployClient(response, fail_with_trace)
+
+    def run():
+        model_serving_utils._get_mlflow_client = lambda: client
+        model_serving_utils.query_endpoint(ENDPOINT_NAME, messages, max_tokens=512)
+    return run
+
+
+def _supported_case(task_types):
+    def run():
+        for task_type in task_types:
+            model_serving_utils._get_endpoint_task_type = lambda name, t=task_type: t
+            model_serving_utils.is_endpoint_supported(ENDPOINT_NAME)
+        model_serving_utils._get_endpoint_task_type = lambda name: "agent/v1/responses"
+    return run
+
+
+def build_cases() -> dict:
+    short_history = _history(1)
+    long_history = _history(50)
+    return {
+        "short_history_small_output": _query_case(short_history, _output_response()),
+        "long_history_small_output": _query_case(long_history, _output_response()),
+        "short_history_trace_output_4mb": _query_case(short_history, _output_response(trace_bytes=4_000_000)),
+        "short_history_predictions": _query_case(short_history, _predictions_response()),
+        "short_history_fallback": _query_case(short_history, _output_response(), fail_with_trace=True),
+        "long_history_fallback": _query_case(long_history, _output_response(), fail_with_trace=True),
+        "is_endpoint_supported": _supported_case(
+            ["agent/v1/chat", "AGENT_TASK", "llm/v1/chat", "llm/v1/completions", None]
+        ),
+    }
+
+
+def _loops_for(run, min_time_s: float) -> int:
+    """Pick a loop count that runs for roughly ``min_time_s``."""
+    run()  # warm up caches and imports
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time_s or loops >= 1_000_000:
+            return loops
+        loops *= 10 if elapsed < min_time_s / 10 else 2
+
+
+def _alloc_peak(run, repeats: int) -> int:
+    # Take the smallest peak, so occasional amortized growth (deques, dict resizes) isn't counted.
+    # The cycle collector is paused so garbage from earlier calls can't be freed mid-measurement.
+    alloc_peak = None
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        for _ in range(repeats):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            alloc_peak = peak - before if alloc_peak is None else min(alloc_peak, peak - before)
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return alloc_peak
+
+
+def measure(runs: dict, min_time_s: float = 0.05, repeats: int = 20) -> dict:
+    """
+    Return the best time per call (us) and allocations per call (KB) of each run.
+
+    Repeats are interleaved across runs rather than done back to back, so a
+    burst of load on a shared machine slows every case (and the calibration)
+    alike instead of landing on whichever case happened to be running.
+    """
+    loops = {name: _loops_for(run, min_time_s) for name, run in runs.items()}
+    best = {name: float("inf") for name in runs}
+    for _ in range(repeats):
+        for name, run in runs.items():
+            start = time.perf_counter()
+            for _ in range(loops[name]):
+                run()
+            best[name] = min(best[name], (time.perf_counter() - start) / loops[name])
+
+    return {
+        name: {
+            "time_per_call_us": round(best[name] * 1e6, 2),
+            "alloc_peak_kb": round(_alloc_peak(run, repeats) / 1024, 2),
+            "loops": loops[name],
+        }
+        for name, run in runs.items()
+    }
+
+
+def _calibration_workload():
+    # Dict and list churn similar to what the cases do, independent of our code
+    messages = [{"role": "user", "content": str(i)} for i in range(20)]
+    return [{"role": m.get("role"), "content": m.get("content")} for m in messages]
+
+
+def compare(results: dict, baseline: dict, calibration_us: float,
+            time_threshold: float, alloc_threshold: float, time_floor_us: float = 2.0) -> list:
+    """
+    Return a description of every case that regressed beyond the thresholds.
+
+    A time regression must exceed both ``time_threshold`` (relative) and
+    ``time_floor_us`` (absolute, after speed normalization), so scheduler noise
+    on microsecond-scale cases doesn't fail the gate.
+    """
+    regressions = []
+    # >1 when this run is on a slower (or busier) machine than the baseline
+    speed_factor = calibration_us / baseline["calibration_us"] if baseline.get("calibration_us") else 1.0
+    for name, result in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        expected_us = base["time_per_call_us"] * speed_factor
+        time_ratio = result["time_per_call_us"] / expected_us if expected_us else 1.0
+        # Ignore allocation noise below 1 KB
+        alloc_delta = result["alloc_peak_kb"] - base["alloc_peak_kb"]
+        alloc_ratio = result["alloc_peak_kb"] / base["alloc_peak_kb"] if base["alloc_peak_kb"] else 1.0
+        if time_ratio > 1 + time_threshold and result["time_per_call_us"] - expected_us > time_floor_us:
+            regressions.append(f"{name}: time {base['time_per_call_us']} -> {result['time_per_call_us']} us ({time_ratio:.2f}x)")
+        if alloc_delta > 1 and alloc_ratio > 1 + alloc_threshold:
+            regressions.append(f"{name}: allocations {base['alloc_peak_kb']} -> {result['alloc_peak_kb']} KB ({alloc_ratio:.2f}x)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update-baseline", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--time-threshold", type=float, default=0.50, help="allowed time regression (0.50 = +50%%)")
+    parser.add_argument("--time-floor-us", type=float, default=2.0, help="ignore time regressions smaller than this (us)")
+    parser.add_argument("--alloc-threshold", type=float, default=0.10, help="allowed allocation regression (0.10 = +10%%)")
+    parser.add_argument("--case", action="append", help="only run the named case (repeatable)")
+    args = parser.parse_args()
+
+    # Keep the stubbed endpoint "supported" without calling the workspace API
+    model_serving_utils._get_endpoint_task_type = lambda name: "agent/v1/responses"
+
+    cases = build_cases()
+    if args.case:
+        cases = {name: run for name, run in cases.items() if name in args.case}
+
+    # The reference workload is measured alongside the cases to cancel out machine speed and load
+    results = measure({"calibration": _calibration_workload, **cases})
+    calibration_us = results.pop("calibration")["time_per_call_us"]
+    for name, result in results.items():
+        print(f"{name:36s} {result['time_per_call_us']:>12.2f} us/call {result['alloc_peak_kb']:>10.2f} KB/call")
+    print(f"{'calibration':36s} {calibration_us:>12.2f} us/call")
+
+    if args.update_baseline:
+        baseline = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "calibration_us": calibration_us,
+            "cases": results,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"\n📝 Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n❌ No baseline at {args.baseline}; run with --update-baseline first")
+        return 1
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, calibration_us, args.time_threshold, args.alloc_threshold,
+                          args.time_floor_us)
+    if regressions:
+        print("\n❌ Regressions beyond threshold:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+    print("\n✅ No regressions beyond threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2 @@
+# test_endpoint.py is a manual script that calls a live endpoint, not a unit test
+collect_ignore = ["test_endpoint.py"]
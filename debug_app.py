@@ -6,6 +6,7 @@ Debug version of the app to test endpoint connectivity
 import os
 import streamlit as st
 from mlflow.deployments import get_deploy_client
+from profiling import PROFILE_DIR, list_profiles, top_functions
 
 st.title("🔍 Debug - Endpoint Connectivity Test")
 
@@ -113,6 +114,32 @@ if st.button("🧪 Test Endpoint Connection"):
     except Exception as e:
         st.error(f"❌ Endpoint info failed: {str(e)}")
 
+st.markdown("---")
+st.subheader("📈 Recent Profiles")
+st.caption(
+    f"Profiles of sampled reruns and endpoint calls from `{PROFILE_DIR}`. "
+    "Enable with PROFILING_ENABLED=true, or open the app with ?profile=1 as a profiling admin."
+)
+
+profiles = list_profiles()
+if not profiles:
+    st.info("No profiles recorded yet.")
+
+top_n = st.slider("Hot functions to show", min_value=5, max_value=50, value=15)
+for profile in profiles:
+    label = f"{profile['stem']} · {profile['duration_ms']} ms"
+    if profile.get("peak_memory_kb") is not None:
+        label += f" · peak {profile['peak_memory_kb']} KB"
+    with st.expander(label):
+        try:
+            st.write("**Top functions (cumulative time)**")
+            st.dataframe(top_functions(profile["prof_path"], n=top_n), use_container_width=True)
+        except Exception as e:
+            st.error(f"❌ Could not read profile: {str(e)}")
+        if profile.get("top_allocations"):
+            st.write("**Allocation summary**")
+            st.dataframe(profile["top_allocations"], use_container_width=True)
+
 st.markdown("---")
 st.markdown("**Instructions:**")
 st.markdown("1. Click the test button above")
@@ -0,0 +1,119 @@
+"""
+Keep-warm scheduler for scale-to-zero serving endpoints.
+
+Agent Bricks endpoints that scale to zero make the first question after an
+idle period take tens of seconds. This background thread watches the
+endpoint state through the workspace API and, during configured active
+hours, sends a cheap warm-up invocation whenever the app has been idle for
+KEEP_WARM_IDLE_S seconds.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+
+from metrics import endpoint_metrics
+from model_serving_utils import _get_workspace_client, warm_up_endpoint
+from usage_store import usage_store
+
+logger = logging.getLogger(__name__)
+
+KEEP_WARM_ENABLED = os.getenv('KEEP_WARM_ENABLED', 'false').lower() == 'true'
+# Local hours during which the endpoint is kept warm, e.g. "8-18" (end exclusive)
+KEEP_WARM_ACTIVE_HOURS = os.getenv('KEEP_WARM_ACTIVE_HOURS', '8-18')
+KEEP_WARM_IDLE_S = float(os.getenv('KEEP_WARM_IDLE_S', '600'))
+KEEP_WARM_CHECK_INTERVAL_S = float(os.getenv('KEEP_WARM_CHECK_INTERVAL_S', '60'))
+# Usage-store user id that keep-warm invocations are billed to
+KEEP_WARM_USER_ID = "keep-warm"
+
+
+def parse_active_hours(spec: str) -> tuple:
+    """Parse an "start-end" hour range such as "8-18"."""
+    start, end = (int(part) for part in spec.split("-", 1))
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise ValueError(f"Invalid active hours: {spec}")
+    return start, end
+
+
+def _in_active_hours(hour: int, active_hours: tuple) -> bool:
+    start, end = active_hours
+    if start <= end:
+        return start <= hour < end
+    # Range wraps past midnight, e.g. "20-6"
+    return hour >= start or hour < end
+
+
+class KeepWarmScheduler:
+    """Background thread that keeps an endpoint warm while the app is idle."""
+
+    def __init__(self, endpoint_name: str, active_hours: tuple = (8, 18),
+                 idle_s: float = 600, check_interval_s: float = 60):
+        self.endpoint_name = endpoint_name
+        self.active_hours = active_hours
+        self.idle_s = idle_s
+        self.check_interval_s = check_interval_s
+        self.last_state = None
+        self.last_warmup_at = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="keep-warm", daemon=True)
+
+    def start(self) -> "KeepWarmScheduler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _endpoint_state(self) -> tuple:
+        """Return the endpoint's (ready, config_update) states as strings."""
+        ep = _get_workspace_client().serving_endpoints.get(self.endpoint_name)
+        if ep.state is None:
+            return "UNKNOWN", "UNKNOWN"
+        ready = getattr(ep.state.ready, "value", ep.state.ready)
+        config_update = getattr(ep.state.config_update, "value", ep.state.config_update)
+        return str(ready), str(config_update)
+
+    def tick(self, now: datetime = None) -> bool:
+        """Run one scheduling check. Returns True if a warm-up was sent."""
+        now = now or datetime.now()
+        if not _in_active_hours(now.hour, self.active_hours):
+            return False
+        if endpoint_metrics.idle_seconds() < self.idle_s:
+            return False
+
+        try:
+            ready, config_update = self._endpoint_state()
+            self.last_state = f"{ready}/{config_update}"
+        except Exception as e:
+            # Warm up anyway; the invocation itself will tell whether the endpoint is up
+            logger.warning(f"Could not read endpoint state: {e}")
+        else:
+            if ready != "READY":
+                # Scaled-to-zero endpoints still report READY; NOT_READY means a failed or
+                # in-progress deployment that a warm-up request can't help
+                logger.info(f"Skipping keep-warm, endpoint state is {self.last_state}")
+                return False
+
+        try:
+            latency_ms, usage = warm_up_endpoint(self.endpoint_name)
+        except Exception as e:
+            logger.warning(f"Keep-warm invocation failed: {e}")
+            return False
+
+        usage_store.record(usage, user_id=KEEP_WARM_USER_ID)
+        cold = endpoint_metrics.record_warmup(latency_ms)
+        self.last_warmup_at = now
+        logger.info(
+            f"Keep-warm invocation took {latency_ms:.0f} ms "
+            f"({'cold start' if cold else 'warm'}, state {self.last_state})"
+        )
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval_s):
+            try:
+                self.tick()
+            except Exception as e:
+                # Keep the scheduler alive whatever happens in a single tick
+                logger.error(f"Keep-warm check failed: {e}")
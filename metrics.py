@@ -0,0 +1,109 @@
+"""
+In-process endpoint metrics.
+
+Tracks endpoint call latencies with cold starts counted separately from warm
+calls, so scale-to-zero wake-ups don't distort the normal latency picture.
+A call is classified as a cold start when it is slower than
+COLD_START_LATENCY_MS and the endpoint had been idle for at least
+COLD_START_IDLE_S before it.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+COLD_START_LATENCY_MS = float(os.getenv('COLD_START_LATENCY_MS', '15000'))
+COLD_START_IDLE_S = float(os.getenv('COLD_START_IDLE_S', '600'))
+
+
+def _percentile(values, percentile: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+class EndpointMetrics:
+    """Thread-safe latency and cold-start counters for the serving endpoint."""
+
+    def __init__(self, cold_start_latency_ms: float = COLD_START_LATENCY_MS,
+                 cold_start_idle_s: float = COLD_START_IDLE_S, window: int = 500):
+        self.cold_start_latency_ms = cold_start_latency_ms
+        self.cold_start_idle_s = cold_start_idle_s
+        self._warm_latencies = deque(maxlen=window)
+        self._cold_latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._last_call_at = None
+        self.requests = 0
+        self.cold_starts = 0
+        self.errors = 0
+        self.warmups = 0
+        self.warmup_cold_starts = 0
+        self.speculative_calls = 0
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last endpoint call (infinite if there hasn't been one)."""
+        with self._lock:
+            if self._last_call_at is None:
+                return float("inf")
+            return time.time() - self._last_call_at
+
+    def _classify(self, latency_ms: float, started_at: float) -> bool:
+        idle_s = float("inf") if self._last_call_at is None else started_at - self._last_call_at
+        return latency_ms >= self.cold_start_latency_ms and idle_s >= self.cold_start_idle_s
+
+    def record_call(self, latency_ms: float, error: bool = False) -> bool:
+        """Record a user-facing endpoint call. Returns True if it was a cold start."""
+        now = time.time()
+        with self._lock:
+            cold = self._classify(latency_ms, now - latency_ms / 1000)
+            self.requests += 1
+            if error:
+                self.errors += 1
+            if cold:
+                self.cold_starts += 1
+                self._cold_latencies.append(latency_ms)
+            else:
+                self._warm_latencies.append(latency_ms)
+            self._last_call_at = now
+            return cold
+
+    def record_warmup(self, latency_ms: float) -> bool:
+        """Record a keep-warm invocation. Returns True if it woke a cold endpoint."""
+        now = time.time()
+        with self._lock:
+            cold = self._classify(latency_ms, now - latency_ms / 1000)
+            self.warmups += 1
+            if cold:
+                self.warmup_cold_starts += 1
+            self._last_call_at = now
+            return cold
+
+    def record_speculative(self) -> None:
+        """Record a background speculative call; it keeps the endpoint awake but isn't a user request."""
+        with self._lock:
+            self.speculative_calls += 1
+            self._last_call_at = time.time()
+
+    def snapshot(self) -> dict:
+        """Export current metrics as a plain dict."""
+        with self._lock:
+            warm = list(self._warm_latencies)
+            cold = list(self._cold_latencies)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "cold_starts": self.cold_starts,
+                "warm_p50_ms": _percentile(warm, 50),
+                "warm_p95_ms": _percentile(warm, 95),
+                "cold_p50_ms": _percentile(cold, 50),
+                "cold_p95_ms": _percentile(cold, 95),
+                "warmups": self.warmups,
+                "warmup_cold_starts": self.warmup_cold_starts,
+                "speculative_calls": self.speculative_calls,
+            }
+
+
+endpoint_metrics = EndpointMetrics()
@@ -1,11 +1,145 @@
 from mlflow.deployments import get_deploy_client
 from databricks.sdk import WorkspaceClient
 from openai import OpenAI
+from profiling import maybe_profile
+from output_budget import CHARS_PER_TOKEN, endpoint_latency, estimate_tokens
+from metrics import endpoint_metrics
+from functools import lru_cache
+import itertools
 import os
+import re
+import threading
+import time
 
+# OpenAI clients hold a static token, so they are recreated periodically
+_OPENAI_CLIENT_TTL_S = 1800
+_openai_client_lock = threading.Lock()
+_openai_client = None
+_openai_client_created_at = 0.0
+
+# Longest Retry-After we are willing to wait inside a request before giving up
+MAX_RETRY_AFTER_S = float(os.getenv('MAX_RETRY_AFTER_S', '10'))
+
+# Fraction of responses whose full size is measured; the rest are estimated
+RESPONSE_SIZE_SAMPLE_RATE = float(os.getenv('RESPONSE_SIZE_SAMPLE_RATE', '0.01'))
+_RESPONSE_SIZE_INTERVAL = round(1 / RESPONSE_SIZE_SAMPLE_RATE) if RESPONSE_SIZE_SAMPLE_RATE > 0 else 0
+_response_size_calls = itertools.count()
+# Longer lists (e.g. trace spans) are sized from this many evenly spaced items
+_JSON_SIZE_MAX_LIST_ITEMS = 16
+# Average response bytes beyond the answer text (traces, metadata), from sampled responses
+_response_overhead_bytes = 0.0
+# Role, JSON keys and punctuation per chat message, e.g. {"role": "user", "content": ""}
+_MESSAGE_OVERHEAD_BYTES = 40
+
+
+class EndpointError(Exception):
+    """Base class for serving endpoint errors. ``retryable`` errors may succeed on another attempt."""
+    retryable = True
+
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class EndpointAuthError(EndpointError):
+    """Missing credentials or no CAN_QUERY permission (401/403)."""
+    retryable = False
+
+class EndpointSchemaError(EndpointError):
+    """The endpoint rejected the request format (400/422) or isn't a supported type."""
+    retryable = False
+
+class EndpointRateLimitedError(EndpointError):
+    """The endpoint is throttling requests (429); see ``retry_after``."""
+
+class EndpointUnavailableError(EndpointError):
+    """The endpoint is missing, not ready or failing (404/5xx, connection errors)."""
+
+class EndpointTimeoutError(EndpointError):
+    """The request timed out."""
+
+_ERROR_CODE_CLASSES = {
+    "UNAUTHENTICATED": EndpointAuthError,
+    "PERMISSION_DENIED": EndpointAuthError,
+    "INVALID_PARAMETER_VALUE": EndpointSchemaError,
+    "BAD_REQUEST": EndpointSchemaError,
+    "MALFORMED_REQUEST": EndpointSchemaError,
+    "RESOURCE_EXHAUSTED": EndpointRateLimitedError,
+    "REQUEST_LIMIT_EXCEEDED": EndpointRateLimitedError,
+    "RESOURCE_DOES_NOT_EXIST": EndpointUnavailableError,
+    "TEMPORARILY_UNAVAILABLE": EndpointUnavailableError,
+    "INTERNAL_ERROR": EndpointUnavailableError,
+    "DEADLINE_EXCEEDED": EndpointTimeoutError,
+}
+
+_STATUS_IN_MESSAGE = re.compile(r"\b([45]\d\d)\b (?:Client|Server) Error|status code:? ([45]\d\d)", re.IGNORECASE)
+
+def _error_class_for_status(status_code: int) -> type:
+    if status_code in (401, 403):
+        return EndpointAuthError
+    if status_code in (400, 422):
+        return EndpointSchemaError
+    if status_code == 429:
+        return EndpointRateLimitedError
+    if status_code in (408, 504):
+        return EndpointTimeoutError
+    return EndpointUnavailableError
+
+def _parse_retry_after(response) -> float:
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        # HTTP-date form isn't used by serving endpoints; treat as unknown
+        return None
+
+def classify_error(error: Exception) -> EndpointError:
+    """Map an HTTP, MLflow, Databricks SDK or OpenAI SDK exception to an EndpointError."""
+    if isinstance(error, EndpointError):
+        return error
+
+    message = str(error)
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    lowered = message.lower()
+    if not isinstance(status_code, int):
+        status_code = None
+        # The regex is slow on long messages, so only run it when a status phrase is present
+        if "client error" in lowered or "server error" in lowered or "status code" in lowered:
+            match = _STATUS_IN_MESSAGE.search(message)
+            status_code = int(match.group(1) or match.group(2)) if match else None
+    retry_after = _parse_retry_after(response)
+
+    if status_code is not None:
+        error_class = _error_class_for_status(status_code)
+    elif isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower() or "timed out" in lowered:
+        error_class = EndpointTimeoutError
+    elif getattr(error, "error_code", None) in _ERROR_CODE_CLASSES:
+        error_class = _ERROR_CODE_CLASSES[error.error_code]
+    elif isinstance(error, ConnectionError) or "connection" in type(error).__name__.lower():
+        error_class = EndpointUnavailableError
+    else:
+        error_class = EndpointError
+
+    classified = error_class(message, status_code=status_code, retry_after=retry_after)
+    classified.__cause__ = error
+    return classified
+
+@lru_cache(maxsize=None)
+def _get_workspace_client() -> WorkspaceClient:
+    """Shared workspace client, reused across calls and threads."""
+    return WorkspaceClient()
+
+@lru_cache(maxsize=None)
+def _get_mlflow_client():
+    """Shared MLflow deployments client, reused across calls and threads."""
+    return get_deploy_client('databricks')
+
+@lru_cache(maxsize=32)
 def _get_endpoint_task_type(endpoint_name: str) -> str:
-    """Get the task type of a serving endpoint."""
-    w = WorkspaceClient()
+    """Get the task type of a serving endpoint (cached, it doesn't change between calls)."""
+    w = _get_workspace_client()
     ep = w.serving_endpoints.get(endpoint_name)
     return ep.task
 
@@ -38,151 +172,409 @@ def is_endpoint_supported(endpoint_name: str) -> bool:
 def _validate_endpoint_task_type(endpoint_name: str) -> None:
     """Validate that the endpoint has a supported task type."""
     if not is_endpoint_supported(endpoint_name):
-        raise Exception(
+        raise EndpointSchemaError(
             f"Detected unsupported endpoint type for this chatbot template. "
             f"This chatbot template only supports chat completions-compatible endpoints. "
             f"For a richer chatbot template with support for all conversational endpoints on Databricks, "
             f"see https://docs.databricks.com/aws/en/generative-ai/agent-framework/chat-app"
         )
 
-def _query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_tokens) -> list[dict[str, str]]:
-    """Calls an Agent Bricks endpoint using direct JSON format."""
-    _validate_endpoint_task_type(endpoint_name)
-    
-    # Agent Bricks expects DIRECT JSON payload (not wrapped in dataframe_records/instances)
+def _max_tokens_field(endpoint_name: str) -> str:
+    """Name of the output token limit field the endpoint accepts."""
     try:
-        # Format messages for Agent Bricks
-        formatted_messages = []
-        for msg in messages:
-            formatted_messages.append({
-                "role": msg.get("role", "user"),
-                "content": msg.get("content", "")
-            })
-        
+        task_type = _get_endpoint_task_type(endpoint_name) or ""
+    except Exception:
+        task_type = ""
+    # Chat/completions endpoints read max_tokens; Agent Bricks and agent endpoints read max_output_tokens
+    return "max_tokens" if task_type.lower().startswith("llm/") else "max_output_tokens"
+
+def _is_truncated(res) -> bool:
+    """Whether an MLflow response stopped at the token limit rather than finishing."""
+    if not isinstance(res, dict):
+        return False
+    if res.get("status") == "incomplete":
+        return True
+    for choice in res.get("choices") or res.get("predictions") or ():
+        if isinstance(choice, dict) and choice.get("finish_reason") == "length":
+            return True
+    return False
+
+def _format_messages(messages: list[dict[str, str]]) -> list[dict[str, str]]:
+    """Format chat history messages for Agent Bricks."""
+    formatted_messages = []
+    for msg in messages:
+        formatted_messages.append({
+            "role": msg.get("role", "user"),
+            "content": msg.get("content", "")
+        })
+    return formatted_messages
+
+def _parse_mlflow_response(res) -> list[dict[str, str]]:
+    """Extract the assistant message from an MLflow deployments response."""
+    # Handle Agent Bricks direct response format
+    if "output" in res:
+        # Direct Agent Bricks response
+        output = res["output"]
+        if isinstance(output, list) and len(output) > 0:
+            first_output = output[0]
+            if isinstance(first_output, dict) and "content" in first_output:
+                content_list = first_output["content"]
+                if isinstance(content_list, list) and len(content_list) > 0:
+                    # Extract text from content
+                    content_item = content_list[0]
+                    if isinstance(content_item, dict) and "text" in content_item:
+                        return [{"role": "assistant", "content": content_item["text"]}]
+                    return [{"role": "assistant", "content": str(content_item)}]
+            return [{"role": "assistant", "content": str(first_output)}]
+        return [{"role": "assistant", "content": str(output)}]
+    elif "predictions" in res and len(res["predictions"]) > 0:
+        # Fallback to predictions format
+        prediction = res["predictions"][0]
+        if isinstance(prediction, str):
+            return [{"role": "assistant", "content": prediction}]
+        elif isinstance(prediction, dict) and "content" in prediction:
+            return [{"role": "assistant", "content": prediction["content"]}]
+
+    return [{"role": "assistant", "content": str(res)}]
+
+def _json_size(obj) -> int:
+    """
+    Approximate the JSON-encoded size of an object in bytes.
+
+    Walks the object instead of serializing it, so multi-megabyte trace
+    payloads are measured without building a second copy of them. Lists
+    longer than _JSON_SIZE_MAX_LIST_ITEMS are sized from evenly spaced items,
+    which keeps the walk bounded for traces with thousands of spans.
+    """
+    total = 0.0
+    stack = [(obj, 1.0)]
+    while stack:
+        item, weight = stack.pop()
+        if isinstance(item, str):
+            total += weight * (len(item) + 2)
+        elif isinstance(item, dict):
+            total += weight * (2 + 2 * len(item))
+            for key, value in item.items():
+                total += weight * (len(str(key)) + 2)
+                stack.append((value, weight))
+        elif isinstance(item, (list, tuple)):
+            total += weight * (2 + len(item))
+            if len(item) > _JSON_SIZE_MAX_LIST_ITEMS:
+                step = len(item) / _JSON_SIZE_MAX_LIST_ITEMS
+                sampled_weight = weight * step
+                stack.extend((item[int(i * step)], sampled_weight) for i in range(_JSON_SIZE_MAX_LIST_ITEMS))
+            else:
+                stack.extend((child, weight) for child in item)
+        elif item is None or isinstance(item, bool):
+            total += weight * 5
+        else:
+            total += weight * len(str(item))
+    return int(total)
+
+def _usage(messages, response_text: str, usage_fields=None, response=None, measure=None) -> dict:
+    """
+    Build the usage record for a call, preferring token counts reported by the endpoint.
+
+    Request bytes are approximated from the message lengths. Responses can
+    carry multi-megabyte traces, so ``measure(response)`` is only called for a
+    RESPONSE_SIZE_SAMPLE_RATE fraction of calls; the others are sized as the
+    answer text plus the average overhead seen in sampled responses. Without
+    ``measure`` the response is sized from the answer text alone.
+    """
+    global _response_overhead_bytes
+    if not usage_fields:
+        input_tokens = output_tokens = None
+    elif isinstance(usage_fields, dict):
+        input_tokens = usage_fields.get("input_tokens") or usage_fields.get("prompt_tokens")
+        output_tokens = usage_fields.get("output_tokens") or usage_fields.get("completion_tokens")
+    else:
+        # OpenAI SDK usage objects
+        input_tokens = getattr(usage_fields, "input_tokens", None)
+        output_tokens = getattr(usage_fields, "output_tokens", None)
+    estimated = input_tokens is None or output_tokens is None
+
+    input_chars = 0
+    for msg in messages:
+        input_chars += len(msg.get("content") or "")
+    if input_tokens is None:
+        input_tokens = input_chars // CHARS_PER_TOKEN
+    if output_tokens is None:
+        output_tokens = estimate_tokens(response_text)
+
+    response_bytes = len(response_text) + 2
+    bytes_estimated = True
+    if measure is not None:
+        if _RESPONSE_SIZE_INTERVAL and next(_response_size_calls) % _RESPONSE_SIZE_INTERVAL == 0:
+            size = measure(response)
+            _response_overhead_bytes += 0.2 * (max(0, size - response_bytes) - _response_overhead_bytes)
+            response_bytes, bytes_estimated = size, False
+        else:
+            response_bytes += int(_response_overhead_bytes)
+    return {
+        "request_bytes": input_chars + _MESSAGE_OVERHEAD_BYTES * len(messages) + 16,
+        "response_bytes": response_bytes,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "tokens_estimated": estimated,
+        "bytes_estimated": bytes_estimated,
+    }
+
+def estimate_usage(messages, response_text: str) -> dict:
+    """Estimate usage for a call whose raw payloads weren't available (e.g. streaming)."""
+    return _usage(messages, response_text)
+
+def _query_mlflow(endpoint_name: str, messages: list[dict[str, str]], max_tokens, return_trace: bool) -> list[dict[str, str]]:
+    """Calls the endpoint through the MLflow deployments client using direct JSON format."""
+    # Agent Bricks expects DIRECT JSON payload (not wrapped in dataframe_records/instances)
+    payload = {
+        "input": _format_messages(messages)
+    }
+    if max_tokens:
+        payload[_max_tokens_field(endpoint_name)] = max_tokens
+    if return_trace:
         # Direct JSON payload format (from curl example)
-        payload = {
-            "input": formatted_messages,
-            "databricks_options": {
-                "return_trace": True
-            }
+        payload["databricks_options"] = {
+            "return_trace": True
         }
-        
-        res = get_deploy_client('databricks').predict(
-            endpoint=endpoint_name,
-            inputs=payload,  # Direct payload, not wrapped
-        )
-        
-        # Handle Agent Bricks direct response format
-        if "output" in res:
-            # Direct Agent Bricks response
-            output = res["output"]
-            if isinstance(output, list) and len(output) > 0:
-                first_output = output[0]
-                if isinstance(first_output, dict) and "content" in first_output:
-                    content_list = first_output["content"]
-                    if isinstance(content_list, list) and len(content_list) > 0:
-                        # Extract text from content
-                        content_item = content_list[0]
-                        if isinstance(content_item, dict) and "text" in content_item:
-                            return [{"role": "assistant", "content": content_item["text"]}]
-                        return [{"role": "assistant", "content": str(content_item)}]
-                return [{"role": "assistant", "content": str(first_output)}]
-            return [{"role": "assistant", "content": str(output)}]
-        elif "predictions" in res and len(res["predictions"]) > 0:
-            # Fallback to predictions format
-            prediction = res["predictions"][0]
-            if isinstance(prediction, str):
-                return [{"role": "assistant", "content": prediction}]
-            elif isinstance(prediction, dict) and "content" in prediction:
-                return [{"role": "assistant", "content": prediction["content"]}]
-        
-        return [{"role": "assistant", "content": str(res)}]
-        
-    except Exception as e:
-        # Try alternative direct format (without databricks_options)
+
+    res = _get_mlflow_client().predict(
+        endpoint=endpoint_name,
+        inputs=payload,  # Direct payload, not wrapped
+    )
+    result = _parse_mlflow_response(res)
+    usage_fields = res.get("usage") if isinstance(res, dict) else None
+    result[-1]["usage"] = _usage(payload["input"], result[-1]["content"], usage_fields, res, _json_size)
+    result[-1]["truncated"] = _is_truncated(res)
+    return result
+
+def _create_openai_client() -> OpenAI:
+    """Create an OpenAI client pointed at the workspace serving endpoints."""
+    # Get Databricks token
+    databricks_token = os.getenv('DATABRICKS_TOKEN')
+    if not databricks_token:
+        # In Databricks Apps, token might be available through service principal
+        try:
+            w = _get_workspace_client()
+            databricks_token = w.config.token
+        except:
+            raise EndpointAuthError("No authentication token available")
+
+    # Get workspace URL from environment or workspace client
+    workspace_url = os.getenv('DATABRICKS_WORKSPACE_URL')
+    if not workspace_url:
         try:
-            # Simplified direct format
-            formatted_messages = []
-            for msg in messages:
-                formatted_messages.append({
-                    "role": msg.get("role", "user"),
-                    "content": msg.get("content", "")
-                })
-            
-            # Minimal direct payload
-            payload = {
-                "input": formatted_messages
-            }
-            
-            res = get_deploy_client('databricks').predict(
-                endpoint=endpoint_name,
-                inputs=payload,
-            )
-            
-            # Handle response same as above
-            if "output" in res:
-                output = res["output"]
-                if isinstance(output, list) and len(output) > 0:
-                    first_output = output[0]
-                    if isinstance(first_output, dict) and "content" in first_output:
-                        content_list = first_output["content"]
-                        if isinstance(content_list, list) and len(content_list) > 0:
-                            content_item = content_list[0]
-                            if isinstance(content_item, dict) and "text" in content_item:
-                                return [{"role": "assistant", "content": content_item["text"]}]
-                            return [{"role": "assistant", "content": str(content_item)}]
-                    return [{"role": "assistant", "content": str(first_output)}]
-                return [{"role": "assistant", "content": str(output)}]
-            return [{"role": "assistant", "content": str(res)}]
-            
-        except Exception as e2:
-            # Final attempt with OpenAI client (if token available)
+            w = _get_workspace_client()
+            workspace_url = w.config.host
+        except:
+            raise EndpointAuthError("No workspace URL available")
+
+    # Initialize OpenAI client with Databricks endpoint
+    return OpenAI(
+        api_key=databricks_token,
+        base_url=f"{workspace_url}/serving-endpoints"
+    )
+
+def _get_openai_client() -> OpenAI:
+    """Shared OpenAI client, recreated every _OPENAI_CLIENT_TTL_S seconds."""
+    global _openai_client, _openai_client_created_at
+    with _openai_client_lock:
+        if _openai_client is None or time.time() - _openai_client_created_at > _OPENAI_CLIENT_TTL_S:
+            _openai_client = _create_openai_client()
+            _openai_client_created_at = time.time()
+        return _openai_client
+
+def _query_openai(endpoint_name: str, messages: list[dict[str, str]], max_tokens) -> list[dict[str, str]]:
+    """Calls the endpoint with the OpenAI client (if token available)."""
+    client = _get_openai_client()
+
+    # Call the Agent Bricks endpoint using OpenAI format (exact playground format)
+    kwargs = {"max_output_tokens": max_tokens} if max_tokens else {}
+    response = client.responses.create(
+        model=endpoint_name,
+        input=messages,  # Pass messages in exact playground format
+        **kwargs
+    )
+
+    # Extract the response text from Agent Bricks format
+    response_text = response.output[0].content[0].text
+    usage = _usage(messages, response_text, getattr(response, "usage", None),
+                   response, lambda r: len(r.model_dump_json()))
+    truncated = getattr(response, "status", None) == "incomplete"
+    return [{"role": "assistant", "content": response_text, "usage": usage, "truncated": truncated}]
+
+# Fallback order of the blocking transports
+_STAGES = ("mlflow_trace", "mlflow_minimal", "openai")
+
+def _query_stage(stage: str, endpoint_name: str, messages: list[dict[str, str]], max_tokens) -> list[dict[str, str]]:
+    if stage == "openai":
+        # Final attempt with OpenAI client
+        return _query_openai(endpoint_name, messages, max_tokens)
+    # mlflow_minimal is the alternative direct format (without databricks_options)
+    return _query_mlflow(endpoint_name, messages, max_tokens, return_trace=stage == "mlflow_trace")
+
+def _call_with_retry_after(call, *args):
+    """Run a transport call, waiting out one short Retry-After on 429 before retrying."""
+    try:
+        return call(*args)
+    except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, EndpointRateLimitedError) and error.retry_after is not None \
+                and error.retry_after <= MAX_RETRY_AFTER_S:
+            time.sleep(error.retry_after)
             try:
-                # Get Databricks token
-                databricks_token = os.getenv('DATABRICKS_TOKEN')
-                if not databricks_token:
-                    # In Databricks Apps, token might be available through service principal
-                    try:
-                        from databricks.sdk import WorkspaceClient
-                        w = WorkspaceClient()
-                        databricks_token = w.config.token
-                    except:
-                        raise Exception("No authentication token available")
-                
-                # Get workspace URL from environment or workspace client
-                workspace_url = os.getenv('DATABRICKS_WORKSPACE_URL')
-                if not workspace_url:
-                    try:
-                        from databricks.sdk import WorkspaceClient
-                        w = WorkspaceClient()
-                        workspace_url = w.config.host
-                    except:
-                        raise Exception("No workspace URL available")
-                
-                # Initialize OpenAI client with Databricks endpoint
-                client = OpenAI(
-                    api_key=databricks_token,
-                    base_url=f"{workspace_url}/serving-endpoints"
-                )
-                
-                # Call the Agent Bricks endpoint using OpenAI format (exact playground format)
-                response = client.responses.create(
-                    model=endpoint_name,
-                    input=messages  # Pass messages in exact playground format
-                )
-                
-                # Extract the response text from Agent Bricks format
-                response_text = response.output[0].content[0].text
-                return [{"role": "assistant", "content": response_text}]
-                
-            except Exception as e3:
-                raise Exception(f"All approaches failed. MLflow1: {e}, MLflow2: {e2}, OpenAI: {e3}")
-
-
-def query_endpoint(endpoint_name, messages, max_tokens):
+                return call(*args)
+            except Exception as e2:
+                raise classify_error(e2)
+        raise error
+
+def _query_endpoint(endpoint_name: str, messages: list[dict[str, str]], max_tokens,
+                    return_trace: bool = True) -> list[dict[str, str]]:
+    """
+    Calls an Agent Bricks endpoint, falling back through the supported transports.
+
+    Each returned message is tagged with the ``fallback_stage`` that produced it
+    (``mlflow_trace``, ``mlflow_minimal`` or ``openai``) and whether it was
+    ``truncated`` at the token limit. Errors are raised as EndpointError
+    subclasses. Only retryable errors (unavailable, timeout) fall through every
+    stage. Auth errors and rate limiting stop at once, since every transport
+    reaches the same endpoint with the same credentials. A schema error only
+    allows the retry from ``mlflow_trace`` to ``mlflow_minimal``, since it may be
+    caused by ``databricks_options`` alone.
+    With ``return_trace=False`` the trace-requesting stage is skipped.
+    """
+    _validate_endpoint_task_type(endpoint_name)
+
+    failures = None
+    for stage in _STAGES if return_trace else _STAGES[1:]:
+        try:
+            result = _call_with_retry_after(_query_stage, stage, endpoint_name, messages, max_tokens)
+        except EndpointError as error:
+            if failures is None:
+                failures = []
+            failures.append((stage, error))
+            trace_schema_error = stage == "mlflow_trace" and isinstance(error, EndpointSchemaError)
+            if isinstance(error, EndpointRateLimitedError) or (not error.retryable and not trace_schema_error):
+                break
+            continue
+
+        for message in result:
+            message["fallback_stage"] = stage
+        return result
+
+    if len(failures) == 1:
+        raise failures[0][1]
+    # Report the most specific classification seen, preferring later stages
+    error = next((e for _, e in reversed(failures) if type(e) is not EndpointError), failures[-1][1])
+    details = ", ".join(f"{failed_stage}: {e}" for failed_stage, e in failures)
+    raise type(error)(
+        f"All approaches failed. {details}",
+        status_code=error.status_code,
+        retry_after=error.retry_after,
+    ) from error
+
+
+def query_endpoint(endpoint_name, messages, max_tokens, speculative=False):
     """
     Query a chat-completions or agent serving endpoint
     If querying an agent serving endpoint that returns multiple messages, this method
-    returns the last message
-    ."""
-    return _query_endpoint(endpoint_name, messages, max_tokens)[-1]
+    returns the last message.
+    Background ``speculative`` calls are kept out of the request and latency metrics.
+    """
+    with maybe_profile("query_endpoint"):
+        start = time.perf_counter()
+        try:
+            result = _query_endpoint(endpoint_name, messages, max_tokens)[-1]
+        except Exception:
+            if speculative:
+                endpoint_metrics.record_speculative()
+            else:
+                endpoint_metrics.record_call((time.perf_counter() - start) * 1000, error=True)
+            raise
+        if speculative:
+            endpoint_metrics.record_speculative()
+        else:
+            _record_latency((time.perf_counter() - start) * 1000)
+        return result
+
+
+def _record_latency(latency_ms: float) -> None:
+    """Record a successful call; cold starts are kept out of the latency average."""
+    if not endpoint_metrics.record_call(latency_ms):
+        endpoint_latency.record(latency_ms)
+
+
+def warm_up_endpoint(endpoint_name: str) -> tuple:
+    """Send a minimal invocation to wake the endpoint. Returns (latency in ms, usage)."""
+    start = time.perf_counter()
+    result = _query_endpoint(endpoint_name, [{"role": "user", "content": "ping"}], max_tokens=1, return_trace=False)
+    return (time.perf_counter() - start) * 1000, result[-1].get("usage", {})
+
+
+def query_endpoint_stream(endpoint_name, messages, max_tokens, deadline_s=None, stream_info=None):
+    """
+    Stream the assistant response as text chunks.
+
+    Streaming stops early once roughly ``max_tokens`` tokens have been received
+    or ``deadline_s`` seconds have passed, whichever comes first. If the
+    endpoint can't stream, the blocking ``query_endpoint`` answer is yielded as
+    a single chunk. Pass a dict as ``stream_info`` to receive the
+    ``fallback_stage`` that answered and whether the answer was ``truncated``.
+
+    The deadline is also passed to the client as its request timeout, since
+    it is otherwise only checked when a delta arrives.
+    """
+    if stream_info is None:
+        stream_info = {}
+    _validate_endpoint_task_type(endpoint_name)
+    request_options = {"timeout": deadline_s} if deadline_s is not None else {}
+    start = time.perf_counter()
+    try:
+        stream = _get_openai_client().responses.create(
+            model=endpoint_name,
+            input=_format_messages(messages),
+            max_output_tokens=max_tokens,
+            stream=True,
+            **request_options,
+        )
+    except Exception as e:
+        error = classify_error(e)
+        if not error.retryable or isinstance(error, EndpointRateLimitedError):
+            endpoint_metrics.record_call((time.perf_counter() - start) * 1000, error=True)
+            raise error
+        print(f"Warning: Streaming unavailable, falling back to blocking query: {e}")
+        message = query_endpoint(endpoint_name, messages, max_tokens)
+        stream_info["fallback_stage"] = message.get("fallback_stage")
+        stream_info["truncated"] = message.get("truncated", False)
+        yield message["content"]
+        return
+
+    stream_info["fallback_stage"] = "openai_stream"
+    stream_info["truncated"] = False
+    received_chars = 0
+    failed = False
+    try:
+        for event in stream:
+            event_type = getattr(event, "type", None)
+            if event_type == "response.incomplete":
+                stream_info["truncated"] = True
+            if event_type != "response.output_text.delta":
+                continue
+            yield event.delta
+            received_chars += len(event.delta)
+            if max_tokens and received_chars >= max_tokens * CHARS_PER_TOKEN:
+                stream_info["truncated"] = True
+                break
+            if deadline_s is not None and time.perf_counter() - start >= deadline_s:
+                stream_info["truncated"] = True
+                break
+    except Exception as e:
+        failed = True
+        raise classify_error(e)
+    finally:
+        # Closing the stream stops generation on the server side
+        stream.close()
+        latency_ms = (time.perf_counter() - start) * 1000
+        if failed:
+            endpoint_metrics.record_call(latency_ms, error=True)
+        else:
+            _record_latency(latency_ms)
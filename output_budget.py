@@ -0,0 +1,81 @@
+"""
+Adaptive output token budgets.
+
+Picks a max_tokens limit for a question from its type (quick lookup,
+explanation or game scenario) and scales it down while the endpoint is
+responding slowly, so long answers don't make a slow endpoint slower.
+"""
+
+import os
+import re
+import threading
+
+DEFAULT_MAX_TOKENS = int(os.getenv('DEFAULT_MAX_TOKENS', '512'))
+MIN_MAX_TOKENS = int(os.getenv('MIN_MAX_TOKENS', '128'))
+# Endpoint latency (EWMA, ms) above which budgets start shrinking
+SLOW_LATENCY_MS = float(os.getenv('SLOW_LATENCY_MS', '8000'))
+
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+
+_QUESTION_BUDGETS = {
+    "lookup": 256,       # "What is a balk?", "When is a catch complete?"
+    "explanation": 512,  # "How does overtime work?", "difference between ..."
+    "scenario": 768,     # Multi-part game situations
+}
+
+_EXPLANATION_PATTERN = re.compile(r"\b(how|why|explain|difference|compare|versus|vs)\b")
+_SCENARIO_PATTERN = re.compile(r"\b(if|scenario|situation|suppose|happens when|what happens)\b")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text."""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def classify_question(question: str) -> str:
+    """Classify a question as ``lookup``, ``explanation`` or ``scenario``."""
+    text = question.lower()
+    if _SCENARIO_PATTERN.search(text) or len(text) > 200:
+        return "scenario"
+    if _EXPLANATION_PATTERN.search(text):
+        return "explanation"
+    return "lookup"
+
+
+class LatencyTracker:
+    """Exponentially weighted moving average of endpoint latency."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.ewma_ms = None
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            if self.ewma_ms is None:
+                self.ewma_ms = latency_ms
+            else:
+                self.ewma_ms = self.alpha * latency_ms + (1 - self.alpha) * self.ewma_ms
+
+
+endpoint_latency = LatencyTracker()
+
+
+def choose_max_tokens(question: str, latency_ms: float = None) -> int:
+    """
+    Pick an output budget for a question.
+
+    ``latency_ms`` defaults to the current endpoint latency EWMA. Budgets are
+    halved once latency reaches twice SLOW_LATENCY_MS.
+    """
+    budget = _QUESTION_BUDGETS.get(classify_question(question), DEFAULT_MAX_TOKENS)
+    if latency_ms is None:
+        latency_ms = endpoint_latency.ewma_ms
+    if latency_ms and latency_ms > SLOW_LATENCY_MS:
+        # Scale linearly from 100% at SLOW_LATENCY_MS down to 50% at twice that
+        overload = min(1.0, (latency_ms - SLOW_LATENCY_MS) / SLOW_LATENCY_MS)
+        budget = int(budget * (1 - 0.5 * overload))
+    return max(MIN_MAX_TOKENS, budget)
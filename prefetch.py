@@ -0,0 +1,197 @@
+"""
+Speculative prefetch of likely follow-up questions.
+
+After a turn finishes, the most common follow-ups to the question just
+answered (mined from logged conversations and from live traffic) are offered
+as one-click suggestions, once enough sessions have asked them. Their answers are generated in the background on a
+small, shared worker pool under a per-session budget, so a clicked
+suggestion can be shown without waiting for a full generation. Speculations
+that aren't used are evicted when the next question is asked.
+"""
+
+import logging
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from question_cache import NearDuplicateIndex, normalize_question
+from request_log import read_request_log
+
+logger = logging.getLogger(__name__)
+
+
+class FollowUpMiner:
+    """
+    Counts which questions users ask next, grouping near-duplicate phrasings.
+
+    A follow-up is only suggested once it has been asked ``min_count`` times
+    from at least ``min_sessions`` distinct sessions, so one user's repeated
+    or unusual question isn't shown to everyone else.
+    """
+
+    def __init__(self, max_questions: int = 2000, max_follow_ups: int = 10,
+                 min_count: int = 3, min_sessions: int = 2):
+        self.max_questions = max_questions
+        self.max_follow_ups = max_follow_ups
+        self.min_count = min_count
+        self.min_sessions = min_sessions
+        # Maps any phrasing of a question to its canonical (first seen) phrasing
+        self._index = NearDuplicateIndex(max_entries=max_questions)
+        self._follow_ups = OrderedDict()  # canonical question -> Counter of normalized follow-ups
+        # canonical question -> {normalized follow-up: session ids}, up to min_sessions each
+        self._sessions = {}
+        self._phrasings = {}  # normalized follow-up -> display text
+        self._lock = threading.Lock()
+
+    def _canonical(self, question: str, insert: bool):
+        match = self._index.lookup(question)
+        if match:
+            return match["answer"]
+        if insert:
+            self._index.insert(question, question)
+            return question
+        return None
+
+    def observe(self, question: str, follow_up: str, session_id: str = None) -> None:
+        """Record that ``follow_up`` was asked right after ``question`` in ``session_id``."""
+        key = normalize_question(follow_up)
+        if not key or key == normalize_question(question):
+            return
+        with self._lock:
+            canonical = self._canonical(question, insert=True)
+            counter = self._follow_ups.pop(canonical, None) or Counter()
+            sessions = self._sessions.setdefault(canonical, {})
+            counter[key] += 1
+            seen = sessions.setdefault(key, set())
+            if session_id and len(seen) < self.min_sessions:
+                seen.add(session_id)
+            self._phrasings.setdefault(key, follow_up)
+            if len(counter) > 2 * self.max_follow_ups:
+                counter = Counter(dict(counter.most_common(self.max_follow_ups)))
+                self._sessions[canonical] = {k: sessions[k] for k in counter if k in sessions}
+            self._follow_ups[canonical] = counter
+            while len(self._follow_ups) > self.max_questions:
+                evicted, _ = self._follow_ups.popitem(last=False)
+                self._sessions.pop(evicted, None)
+
+    def top(self, question: str, n: int = 3) -> list:
+        """Return up to ``n`` of the most common follow-ups to a question that have enough support."""
+        with self._lock:
+            canonical = self._canonical(question, insert=False)
+            counter = self._follow_ups.get(canonical) if canonical else None
+            if not counter:
+                return []
+            sessions = self._sessions.get(canonical, {})
+            supported = [
+                key for key, count in counter.most_common()
+                if count >= self.min_count and len(sessions.get(key, ())) >= self.min_sessions
+            ]
+            return [self._phrasings[key] for key in supported[:n]]
+
+    def load_request_log(self, path: str) -> int:
+        """Mine consecutive user questions from a request log. Returns the number of pairs."""
+        pairs = 0
+        for record in read_request_log(path):
+            questions = [m.get("content", "") for m in record.get("messages") or [] if m.get("role") == "user"]
+            if len(questions) >= 2:
+                self.observe(questions[-2], questions[-1], session_id=record.get("session_id"))
+                pairs += 1
+        return pairs
+
+
+class SpeculativePrefetcher:
+    """
+    Pre-generates answers to suggested follow-ups in the background.
+
+    ``answer_fn(messages, **context)`` produces the assistant message for a
+    history, where ``context`` is whatever was passed to ``speculate``. A
+    speculation is keyed by the history it was generated for plus the
+    follow-up question, so it is only reused when the user asks exactly that
+    question next.
+    """
+
+    def __init__(self, answer_fn, max_workers: int = 1, budget_per_session: int = 10,
+                 max_sessions: int = 500):
+        self.answer_fn = answer_fn
+        self.budget_per_session = budget_per_session
+        self.max_sessions = max_sessions
+        # A small shared pool keeps speculation from competing with real questions
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+        self._sessions = OrderedDict()  # session id -> {"spent": int, "pending": {key: future}}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.wasted = 0
+
+    @staticmethod
+    def _key(history: list, question: str) -> tuple:
+        return len(history), question
+
+    def _session(self, session_id: str) -> dict:
+        state = self._sessions.pop(session_id, None) or {"spent": 0, "pending": {}}
+        self._sessions[session_id] = state
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            self._discard(evicted)
+        return state
+
+    def _discard(self, state: dict) -> None:
+        for future in state["pending"].values():
+            if not future.cancel() and future.done():
+                self.wasted += 1
+        state["pending"] = {}
+
+    def speculate(self, session_id: str, history: list, questions: list, **context) -> list:
+        """Schedule answers for ``questions`` within the session budget. Returns those scheduled."""
+        scheduled = []
+        with self._lock:
+            state = self._session(session_id)
+            for question in questions:
+                if state["spent"] >= self.budget_per_session:
+                    break
+                key = self._key(history, question)
+                if key in state["pending"]:
+                    continue
+                messages = list(history) + [{"role": "user", "content": question}]
+                state["pending"][key] = self._executor.submit(self.answer_fn, messages, **context)
+                state["spent"] += 1
+                scheduled.append(question)
+        return scheduled
+
+    def take(self, session_id: str, history: list, question: str, timeout: float = None):
+        """
+        Claim the speculated answer for ``question`` and evict the session's other speculations.
+
+        Waits up to ``timeout`` seconds for a speculation that is already running.
+        One still queued behind other sessions' speculations is cancelled, since
+        answering directly is faster. Returns the assistant message, or None if
+        there was no usable speculation.
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if not state:
+                return None
+            future = state["pending"].pop(self._key(history, question), None)
+            self._discard(state)
+        if future is None:
+            return None
+        if not future.running() and not future.done() and future.cancel():
+            return None
+        try:
+            message = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # A running call can't be cancelled; its answer will go unused
+            with self._lock:
+                self.wasted += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Speculative answer failed, answering normally: {e}")
+            return None
+        self.hits += 1
+        return message
+
+    def evict(self, session_id: str) -> None:
+        """Drop all of a session's pending speculations."""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state:
+                self._discard(state)
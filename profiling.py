@@ -0,0 +1,196 @@
+"""
+On-demand profiling hooks for Streamlit reruns and endpoint calls.
+
+A sampled fraction of wrapped calls runs under cProfile and is written to
+PROFILE_DIR, keeping the newest PROFILE_MAX_PROFILES:
+
+    <timestamp>-<name>.prof   <- pstats file, open with snakeviz or pstats
+    <timestamp>-<name>.json   <- metadata: duration, top allocations
+
+Profiling is enabled with PROFILING_ENABLED=true and sampled at
+PROFILE_SAMPLE_RATE, or forced for a single rerun by an admin.
+
+Allocation capture (PROFILE_ALLOCATIONS=true) is opt-in: tracemalloc traces
+the whole process while a profile runs, which slows every concurrent
+session, and the summary includes other threads' allocations too.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.05'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_PROFILES = int(os.getenv('PROFILE_MAX_PROFILES', '200'))
+PROFILE_ALLOCATIONS = os.getenv('PROFILE_ALLOCATIONS', 'false').lower() == 'true'
+# Comma-separated emails allowed to force profiling with the ?profile=1 query param
+PROFILING_ADMINS = {
+    email.strip().lower() for email in os.getenv('PROFILING_ADMINS', '').split(',') if email.strip()
+}
+
+_local = threading.local()
+# Only one profile runs at a time per process; concurrent cProfile sessions fail on 3.12+
+_profile_lock = threading.Lock()
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def is_profiling_admin(user_email) -> bool:
+    """Check whether a user may force profiling through the query param."""
+    return bool(user_email) and user_email.lower() in PROFILING_ADMINS
+
+
+def should_profile(force: bool = False) -> bool:
+    """Decide whether the next call should be profiled."""
+    if getattr(_local, "active", False):
+        # Already inside a profiled call on this thread; cProfile can't nest
+        return False
+    if force:
+        return True
+    return PROFILING_ENABLED and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+@contextmanager
+def maybe_profile(name: str, force: bool = False):
+    """Profile the enclosed block if it is sampled (or forced), otherwise do nothing."""
+    if not should_profile(force) or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    _local.active = True
+    profiler = cProfile.Profile()
+    enabled = False
+    trace_allocations = PROFILE_ALLOCATIONS
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        if trace_allocations:
+            _start_tracemalloc()
+        try:
+            profiler.enable()
+            enabled = True
+        except ValueError as e:
+            # Another profiler (e.g. a debugger) already owns the interpreter hooks
+            logger.warning(f"Skipping profile of {name}: {e}")
+        yield
+    finally:
+        if enabled:
+            profiler.disable()
+        duration = time.perf_counter() - start
+        snapshot, peak = None, None
+        try:
+            if enabled and trace_allocations:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if trace_allocations:
+                _stop_tracemalloc()
+            _local.active = False
+            _profile_lock.release()
+        if enabled:
+            try:
+                _write_profile(name, started_at, duration, profiler, snapshot, peak)
+            except Exception as e:
+                logger.error(f"Failed to write profile for {name}: {e}")
+
+
+def _write_profile(name, started_at, duration, profiler, snapshot, peak) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started_at))}-{int(started_at * 1000) % 1000:03d}-{name}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{stem}.prof"))
+
+    top_allocations = []
+    for stat in snapshot.statistics("lineno")[:10] if snapshot else ():
+        frame = stat.traceback[0]
+        top_allocations.append({
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        })
+
+    metadata = {
+        "name": name,
+        "started_at": started_at,
+        "duration_ms": round(duration * 1000, 1),
+        "peak_memory_kb": round(peak / 1024, 1) if peak is not None else None,
+        "top_allocations": top_allocations,
+    }
+    with open(os.path.join(PROFILE_DIR, f"{stem}.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    logger.info(f"Wrote profile {stem} ({metadata['duration_ms']} ms)")
+    _prune_profiles()
+
+
+def _prune_profiles() -> None:
+    """Delete the oldest profiles beyond PROFILE_MAX_PROFILES."""
+    stems = sorted({os.path.splitext(f)[0] for f in os.listdir(PROFILE_DIR) if f.endswith((".prof", ".json"))})
+    for stem in stems[:max(0, len(stems) - PROFILE_MAX_PROFILES)]:
+        for extension in (".prof", ".json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stem + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 20) -> list:
+    """Return metadata for the most recent profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    stems = sorted(
+        (f[:-len(".json")] for f in os.listdir(PROFILE_DIR) if f.endswith(".json")),
+        reverse=True,
+    )[:limit]
+    profiles = []
+    for stem in stems:
+        try:
+            with open(os.path.join(PROFILE_DIR, f"{stem}.json"), encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metadata["stem"] = stem
+        metadata["prof_path"] = os.path.join(PROFILE_DIR, f"{stem}.prof")
+        profiles.append(metadata)
+    return profiles
+
+
+def top_functions(prof_path: str, n: int = 15, sort_by: str = "cumulative") -> list:
+    """Summarize the hottest functions of a saved profile."""
+    stats = pstats.Stats(prof_path)
+    stats.sort_stats(sort_by)
+    rows = []
+    for func in stats.fcn_list[:n]:
+        filename, lineno, funcname = func
+        cc, nc, tt, ct, _ = stats.stats[func]
+        rows.append({
+            "function": f"{funcname} ({os.path.basename(filename)}:{lineno})",
+            "calls": nc,
+            "self_ms": round(tt * 1000, 2),
+            "cumulative_ms": round(ct * 1000, 2),
+        })
+    return rows
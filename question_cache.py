@@ -0,0 +1,222 @@
+"""
+Near-duplicate question cache using MinHash / locality-sensitive hashing.
+
+Users phrase the same question many ways ("How does NFL playoff overtime work?"
+vs "How does overtime work in NFL playoffs?"), so an exact-key cache misses most
+of the reuse. This index stores normalized first-turn questions with their
+answers and finds previously answered questions whose estimated Jaccard
+similarity is above a threshold.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Mersenne prime used for the universal hash family (a * x + b) mod p
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Words that carry no meaning for matching rules questions. Question words
+# (what, how, when, why, ...) are deliberately kept: "When can a runner steal
+# home?" and "How can a runner steal home?" need different answers.
+_STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "do", "does",
+    "did", "in", "on", "at", "of", "for", "to", "and", "or", "can", "i", "me",
+    "my", "you", "your", "it", "its", "there", "this", "that", "with", "about",
+    "please",
+})
+
+# Contractions that should match their question word
+_ALIASES = {"whats": "what", "hows": "how", "whens": "when", "wheres": "where", "whos": "who"}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _stem(token: str) -> str:
+    """Very small plural stemmer so 'playoffs' matches 'playoff'."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize_question(question: str) -> frozenset:
+    """Turn a question into the set of tokens used for similarity matching."""
+    text = question.lower().replace("'", "")
+    words = [_ALIASES.get(t, t) for t in _TOKEN_PATTERN.findall(text)]
+    tokens = {_stem(t) for t in words if t not in _STOPWORDS}
+    if not tokens:
+        # Question was all stopwords, fall back to the raw words
+        tokens = set(words)
+    return frozenset(tokens)
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class NearDuplicateIndex:
+    """
+    In-memory MinHash LSH index mapping questions to stored answers.
+
+    Signatures are split into ``num_bands`` bands of ``rows_per_band`` rows; any
+    entry sharing a band with the query is a candidate, and candidates are
+    accepted when their estimated similarity reaches ``threshold``. Memory is
+    bounded by ``max_entries`` with least-recently-used eviction, and entries
+    older than ``ttl_s`` seconds (if set) are no longer served.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_bands: int = 16, rows_per_band: int = 4,
+                 max_entries: int = 1000, audit_size: int = 200, seed: int = 1,
+                 ttl_s: float = None):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.num_perm = num_bands * rows_per_band
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+
+        # Deterministic permutation parameters so signatures are stable across reruns
+        rng_state = hashlib.sha256(str(seed).encode("utf-8")).digest()
+        self._permutations = []
+        for i in range(self.num_perm):
+            digest = hashlib.sha256(rng_state + i.to_bytes(4, "big")).digest()
+            a = int.from_bytes(digest[:8], "big") % (_MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:16], "big") % _MERSENNE_PRIME
+            self._permutations.append((a, b))
+
+        self._entries = OrderedDict()  # key -> entry dict, in LRU order
+        self._keys_by_tokens = {}  # normalized question -> key
+        self._buckets = [dict() for _ in range(num_bands)]  # band hash -> set of keys
+        self._audit = deque(maxlen=audit_size)
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _signature(self, tokens: frozenset) -> tuple:
+        hashes = [_token_hash(t) for t in tokens]
+        signature = []
+        for a, b in self._permutations:
+            signature.append(min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes))
+        return tuple(signature)
+
+    def _bands(self, signature: tuple) -> list:
+        r = self.rows_per_band
+        return [hash(signature[i * r:(i + 1) * r]) for i in range(self.num_bands)]
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._keys_by_tokens.pop(entry["tokens"], None)
+        for band, band_hash in enumerate(entry["bands"]):
+            bucket = self._buckets[band].get(band_hash)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_hash]
+
+    def insert(self, question: str, answer: str) -> None:
+        """Add a question and its answer, replacing an existing identical question."""
+        tokens = normalize_question(question)
+        if not tokens:
+            return
+        signature = self._signature(tokens)
+        bands = self._bands(signature)
+
+        with self._lock:
+            # Drop an existing entry for the same normalized question
+            if tokens in self._keys_by_tokens:
+                self._remove(self._keys_by_tokens[tokens])
+
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                "question": question,
+                "answer": answer,
+                "tokens": tokens,
+                "signature": signature,
+                "bands": bands,
+                "created_at": time.time(),
+            }
+            self._keys_by_tokens[tokens] = key
+            for band, band_hash in enumerate(bands):
+                self._buckets[band].setdefault(band_hash, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def lookup(self, question: str):
+        """
+        Find the best stored match for a question.
+
+        Returns a dict with ``question``, ``answer`` and ``similarity`` or None.
+        """
+        tokens = normalize_question(question)
+        if not tokens:
+            return None
+        signature = self._signature(tokens)
+        bands = self._bands(signature)
+
+        with self._lock:
+            candidates = set()
+            for band, band_hash in enumerate(bands):
+                candidates.update(self._buckets[band].get(band_hash, ()))
+
+            best_key, best_similarity = None, 0.0
+            now = time.time()
+            for key in candidates:
+                if self.ttl_s is not None and now - self._entries[key]["created_at"] > self.ttl_s:
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+                stored = self._entries[key]["signature"]
+                similarity = sum(1 for x, y in zip(signature, stored) if x == y) / self.num_perm
+                if similarity > best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            self.hits += 1
+            match = {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "similarity": best_similarity,
+            }
+            self._audit.append({
+                "timestamp": time.time(),
+                "query": question,
+                "matched_question": entry["question"],
+                "similarity": best_similarity,
+            })
+            return match
+
+    def audit_log(self) -> list:
+        """Return the most recent matches served from the index, oldest first."""
+        with self._lock:
+            return list(self._audit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
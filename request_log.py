@@ -0,0 +1,137 @@
+"""
+Non-blocking request/response log for replay and analysis.
+
+Records are pushed onto a bounded in-memory queue and a background thread
+batches them into a JSONL file, so the chat path never waits on disk I/O.
+When the queue is full new records are dropped (and counted) rather than
+blocking. Files are rotated by size and rotated files are gzip compressed:
+
+    requests.jsonl        <- current file
+    requests.jsonl.1.gz   <- most recent rotated file
+    requests.jsonl.2.gz
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLogWriter:
+    """Background JSONL writer with a bounded queue, batching and gzip rotation."""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 10,
+                 queue_size: int = 10000, batch_size: int = 200, flush_interval: float = 1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, record: dict) -> bool:
+        """Queue a record for writing. Returns False if it was dropped on overflow."""
+        record.setdefault("timestamp", time.time())
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush outstanding records and stop the writer thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    # Never let a logging failure kill the writer thread
+                    logger.error(f"Failed to write request log batch: {e}")
+
+    def _write_batch(self, batch: list) -> None:
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self.written += len(batch)
+        if os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        # Shift existing backups: .1.gz -> .2.gz, ... dropping the oldest
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}.gz"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}.gz")
+        if self.backup_count > 0:
+            with open(self.path, "rb") as f_in, gzip.open(f"{self.path}.1.gz", "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        os.remove(self.path)
+
+
+def _read_lines(lines, source: str, stats: dict):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # e.g. a line torn by a process killed mid-write
+            stats["skipped"] += 1
+            logger.warning(f"Skipping undecodable line in {source}")
+
+
+def read_request_log(path: str, stats: dict = None):
+    """
+    Yield logged records oldest first, across rotated gzip files and the current file.
+
+    Undecodable lines and unreadable backups are skipped; pass a dict as
+    ``stats`` to receive the number of skipped lines under ``"skipped"``.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("skipped", 0)
+    backups = []
+    i = 1
+    while os.path.exists(f"{path}.{i}.gz"):
+        backups.append(f"{path}.{i}.gz")
+        i += 1
+
+    for backup in reversed(backups):
+        try:
+            with gzip.open(backup, "rt", encoding="utf-8") as f:
+                yield from _read_lines(f, backup, stats)
+        except (OSError, EOFError) as e:
+            # Truncated or corrupt archive; keep whatever was read before the damage
+            stats["skipped"] += 1
+            logger.warning(f"Could not finish reading {backup}: {e}")
+
+    if os.path.exists(path):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield from _read_lines(f, path, stats)
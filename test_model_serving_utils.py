@@ -0,0 +1,240 @@
+"""Unit tests for endpoint error classification and transport fallback."""
+
+import pytest
+
+pytest.importorskip("mlflow.deployments")
+pytest.importorskip("databricks.sdk")
+pytest.importorskip("openai")
+
+import model_serving_utils  # noqa: E402
+from model_serving_utils import (  # noqa: E402
+    EndpointAuthError, EndpointError, EndpointRateLimitedError, EndpointSchemaError,
+    EndpointTimeoutError, EndpointUnavailableError, classify_error,
+)
+
+ENDPOINT = "test-endpoint"
+MESSAGES = [{"role": "user", "content": "What is a balk?"}]
+OUTPUT = {"output": [{"content": [{"type": "output_text", "text": "An illegal pitching motion."}]}]}
+
+
+class HTTPError(Exception):
+    def __init__(self, message, status_code=None, headers=None):
+        super().__init__(message)
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+class StubDeployClient:
+    """Fails the first ``len(errors)`` predict calls with the given errors, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.payloads = []
+
+    def predict(self, endpoint, inputs):
+        self.payloads.append(inputs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return OUTPUT
+
+
+@pytest.fixture
+def transports(monkeypatch):
+    """Stub the MLflow client and OpenAI transport; returns a setter and the OpenAI call log."""
+    openai_calls = []
+    state = {"client": StubDeployClient(), "openai_error": None}
+
+    def query_openai(endpoint_name, messages, max_tokens):
+        openai_calls.append(messages)
+        if state["openai_error"]:
+            raise state["openai_error"]
+        return [{"role": "assistant", "content": "From OpenAI", "truncated": False}]
+
+    monkeypatch.setattr(model_serving_utils, "_get_endpoint_task_type", lambda name: "agent/v1/responses")
+    monkeypatch.setattr(model_serving_utils, "_get_mlflow_client", lambda: state["client"])
+    monkeypatch.setattr(model_serving_utils, "_query_openai", query_openai)
+
+    def configure(*mlflow_errors, openai_error=None):
+        state["client"] = StubDeployClient(*mlflow_errors)
+        state["openai_error"] = openai_error
+        return state["client"]
+
+    configure.openai_calls = openai_calls
+    return configure
+
+
+@pytest.mark.parametrize("error, expected", [
+    (HTTPError("denied", status_code=403), EndpointAuthError),
+    (HTTPError("bad", status_code=422), EndpointSchemaError),
+    (HTTPError("slow down", status_code=429), EndpointRateLimitedError),
+    (HTTPError("gateway", status_code=504), EndpointTimeoutError),
+    (HTTPError("missing", status_code=404), EndpointUnavailableError),
+    (Exception("400 Client Error: Bad Request for url"), EndpointSchemaError),
+    (Exception("Error code: 503 - status code: 503"), EndpointUnavailableError),
+    (TimeoutError("read"), EndpointTimeoutError),
+    (Exception("request timed out"), EndpointTimeoutError),
+    (ConnectionError("refused"), EndpointUnavailableError),
+    (Exception("something else"), EndpointError),
+])
+def test_classify_error(error, expected):
+    classified = classify_error(error)
+    assert type(classified) is expected
+    assert classified.__cause__ is error
+
+
+def test_classify_error_reads_error_code_and_retry_after():
+    error = Exception("throttled")
+    error.error_code = "REQUEST_LIMIT_EXCEEDED"
+    assert isinstance(classify_error(error), EndpointRateLimitedError)
+
+    classified = classify_error(HTTPError("slow down", status_code=429, headers={"Retry-After": "3"}))
+    assert classified.retry_after == 3.0
+    assert classified.retryable
+
+
+def test_classify_error_passes_endpoint_errors_through():
+    error = EndpointAuthError("no token")
+    assert classify_error(error) is error
+
+
+def test_first_stage_answers(transports):
+    client = transports()
+    message = model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)[-1]
+    assert message["fallback_stage"] == "mlflow_trace"
+    assert client.payloads[0]["max_output_tokens"] == 256
+    assert "max_tokens" not in client.payloads[0]
+
+
+def test_token_field_follows_task_type(transports, monkeypatch):
+    client = transports()
+    monkeypatch.setattr(model_serving_utils, "_get_endpoint_task_type", lambda name: "llm/v1/chat")
+    model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)
+    assert client.payloads[0]["max_tokens"] == 256
+    assert "max_output_tokens" not in client.payloads[0]
+
+
+def test_trace_schema_error_falls_back_to_minimal_payload(transports):
+    client = transports(Exception("400 Client Error: unknown field databricks_options"))
+    message = model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)[-1]
+    assert message["fallback_stage"] == "mlflow_minimal"
+    assert "databricks_options" not in client.payloads[1]
+
+
+def test_schema_error_on_minimal_payload_is_raised(transports):
+    client = transports(Exception("400 Client Error: bad input"), Exception("400 Client Error: bad input"))
+    with pytest.raises(EndpointSchemaError):
+        model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)
+    assert len(client.payloads) == 2
+    assert transports.openai_calls == []
+
+
+def test_auth_error_stops_fallbacks(transports):
+    client = transports(HTTPError("forbidden", status_code=403))
+    with pytest.raises(EndpointAuthError):
+        model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)
+    assert len(client.payloads) == 1
+    assert transports.openai_calls == []
+
+
+def test_unavailable_falls_through_every_stage(transports):
+    client = transports(HTTPError("unavailable", status_code=503), HTTPError("unavailable", status_code=503))
+    message = model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)[-1]
+    assert message["fallback_stage"] == "openai"
+    assert len(client.payloads) == 2
+
+
+def test_rate_limit_stops_fallbacks(transports):
+    transports(HTTPError("slow down", status_code=429, headers={"Retry-After": "120"}))
+    with pytest.raises(EndpointRateLimitedError) as excinfo:
+        model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)
+    assert excinfo.value.retry_after == 120.0
+    assert transports.openai_calls == []
+
+
+def test_short_retry_after_is_waited_out(transports, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(model_serving_utils.time, "sleep", sleeps.append)
+    transports(HTTPError("slow down", status_code=429, headers={"Retry-After": "1"}))
+    message = model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)[-1]
+    assert message["fallback_stage"] == "mlflow_trace"
+    assert sleeps == [1.0]
+
+
+def test_all_stages_failing_raises_most_specific_error(transports):
+    transports(
+        HTTPError("unavailable", status_code=503),
+        HTTPError("unavailable", status_code=503),
+        openai_error=Exception("something else"),
+    )
+    with pytest.raises(EndpointUnavailableError) as excinfo:
+        model_serving_utils._query_endpoint(ENDPOINT, MESSAGES, max_tokens=256)
+    assert "All approaches failed" in str(excinfo.value)
+    assert excinfo.value.status_code == 503
+
+
+def test_stream_unavailable_falls_back_to_blocking(transports, monkeypatch):
+    client = transports()
+
+    def failing_client():
+        raise HTTPError("unavailable", status_code=503)
+
+    monkeypatch.setattr(model_serving_utils, "_get_openai_client", failing_client)
+    stream_info = {}
+    chunks = list(model_serving_utils.query_endpoint_stream(
+        ENDPOINT, MESSAGES, max_tokens=256, stream_info=stream_info,
+    ))
+    assert chunks == ["An illegal pitching motion."]
+    assert stream_info == {"fallback_stage": "mlflow_trace", "truncated": False}
+    assert len(client.payloads) == 1
+
+
+@pytest.mark.parametrize("status_code, expected", [
+    (400, EndpointSchemaError),
+    (403, EndpointAuthError),
+    (429, EndpointRateLimitedError),
+])
+def test_stream_non_retryable_errors_are_raised(transports, monkeypatch, status_code, expected):
+    client = transports()
+
+    def failing_client():
+        raise HTTPError("stream rejected", status_code=status_code)
+
+    monkeypatch.setattr(model_serving_utils, "_get_openai_client", failing_client)
+    with pytest.raises(expected):
+        list(model_serving_utils.query_endpoint_stream(ENDPOINT, MESSAGES, max_tokens=256))
+    assert client.payloads == []
+
+
+def test_stream_errors_after_start_are_classified(monkeypatch):
+    class Delta:
+        type = "response.output_text.delta"
+        delta = "An illegal"
+
+    class BrokenStream:
+        closed = False
+
+        def __iter__(self):
+            yield Delta()
+            raise ConnectionError("reset by peer")
+
+        def close(self):
+            self.closed = True
+
+    stream = BrokenStream()
+    requests = []
+
+    class Responses:
+        def create(self, **kwargs):
+            requests.append(kwargs)
+            return stream
+
+    monkeypatch.setattr(model_serving_utils, "_get_endpoint_task_type", lambda name: "agent/v1/responses")
+    monkeypatch.setattr(model_serving_utils, "_get_openai_client", lambda: type("Client", (), {"responses": Responses()})())
+    errors_before = model_serving_utils.endpoint_metrics.errors
+    chunks = []
+    with pytest.raises(EndpointUnavailableError):
+        for chunk in model_serving_utils.query_endpoint_stream(ENDPOINT, MESSAGES, max_tokens=256, deadline_s=30):
+            chunks.append(chunk)
+    assert chunks == ["An illegal"]
+    assert stream.closed
+    assert requests[0]["timeout"] == 30
+    assert model_serving_utils.endpoint_metrics.errors == errors_before + 1
@@ -0,0 +1,120 @@
+"""Unit tests for follow-up mining and speculative prefetch."""
+
+import json
+import threading
+
+from prefetch import FollowUpMiner, SpeculativePrefetcher
+
+HISTORY = [
+    {"role": "user", "content": "What is a balk?"},
+    {"role": "assistant", "content": "An illegal pitching motion."},
+]
+
+
+def _answer(messages, **context):
+    return {"role": "assistant", "content": f"Answer to {messages[-1]['content']}"}
+
+
+def test_miner_groups_phrasings_and_ranks_follow_ups():
+    miner = FollowUpMiner(min_count=1, min_sessions=1)
+    miner.observe("What is a balk?", "Can a balk happen with no runners on base?", session_id="s1")
+    miner.observe("What's a balk", "Can a balk happen with no runners on base?", session_id="s2")
+    miner.observe("What is a balk?", "What is the penalty for a balk?", session_id="s1")
+    assert miner.top("what is a balk", n=2) == [
+        "Can a balk happen with no runners on base?",
+        "What is the penalty for a balk?",
+    ]
+    assert miner.top("How long is an NBA quarter?") == []
+
+
+def test_miner_requires_minimum_support():
+    miner = FollowUpMiner(min_count=3, min_sessions=2)
+    for _ in range(5):
+        miner.observe("What is a balk?", "Is my neighbor's balk claim right?", session_id="s1")
+    miner.observe("What is a balk?", "What is the penalty for a balk?", session_id="s1")
+    miner.observe("What is a balk?", "What is the penalty for a balk?", session_id="s2")
+    # Asked often, but only ever by one session
+    assert miner.top("What is a balk?") == []
+    miner.observe("What is a balk?", "What is the penalty for a balk?", session_id="s3")
+    assert miner.top("What is a balk?") == ["What is the penalty for a balk?"]
+
+
+def test_miner_mines_request_log_with_sessions(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    lines = [
+        json.dumps({"session_id": f"s{i}", "messages": [
+            {"role": "user", "content": "What is a balk?"},
+            {"role": "assistant", "content": "An illegal pitching motion."},
+            {"role": "user", "content": "What is the penalty for a balk?"},
+        ]})
+        for i in range(3)
+    ]
+    path.write_text("\n".join(lines) + '\n{"session_id": "s9", "mess', encoding="utf-8")
+    miner = FollowUpMiner()
+    assert miner.load_request_log(str(path)) == 3
+    assert miner.top("What is a balk?") == ["What is the penalty for a balk?"]
+
+
+def test_speculate_passes_context_like_the_app():
+    calls = []
+
+    # Same signature as app._speculative_answer
+    def speculative_answer(messages, usage_session_id=None, user_id=None):
+        calls.append((usage_session_id, user_id))
+        return _answer(messages)
+
+    prefetcher = SpeculativePrefetcher(speculative_answer)
+    prefetcher.speculate("s1", HISTORY, ["Q1"], usage_session_id="s1", user_id="u1")
+    assert prefetcher.take("s1", HISTORY, "Q1", timeout=5)["content"] == "Answer to Q1"
+    assert calls == [("s1", "u1")]
+
+
+def test_take_returns_speculated_answer_and_discards_others():
+    prefetcher = SpeculativePrefetcher(_answer)
+    prefetcher.speculate("s1", HISTORY, ["Q1", "Q2"])
+    message = prefetcher.take("s1", HISTORY, "Q1", timeout=5)
+    assert message["content"] == "Answer to Q1"
+    assert prefetcher.hits == 1
+    assert prefetcher.take("s1", HISTORY, "Q2", timeout=5) is None
+
+
+def test_take_cancels_queued_speculation():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_answer(messages, **context):
+        started.set()
+        release.wait(5)
+        return _answer(messages)
+
+    prefetcher = SpeculativePrefetcher(blocking_answer, max_workers=1)
+    prefetcher.speculate("busy", HISTORY, ["Q1"])
+    started.wait(5)
+    # Queued behind the other session's speculation on the single worker
+    prefetcher.speculate("s1", HISTORY, ["Q2"])
+    assert prefetcher.take("s1", HISTORY, "Q2", timeout=5) is None
+    assert prefetcher.hits == 0
+    release.set()
+
+
+def test_take_timeout_counts_running_speculation_as_wasted():
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_answer(messages, **context):
+        started.set()
+        release.wait(5)
+        return _answer(messages)
+
+    prefetcher = SpeculativePrefetcher(slow_answer)
+    prefetcher.speculate("s1", HISTORY, ["Q1"])
+    started.wait(5)
+    assert prefetcher.take("s1", HISTORY, "Q1", timeout=0.01) is None
+    assert prefetcher.wasted == 1
+    release.set()
+
+
+def test_budget_limits_speculation_per_session():
+    prefetcher = SpeculativePrefetcher(_answer, budget_per_session=1)
+    assert prefetcher.speculate("s1", HISTORY, ["Q1", "Q2"]) == ["Q1"]
+    assert prefetcher.speculate("s2", HISTORY, ["Q1"]) == ["Q1"]
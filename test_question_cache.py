@@ -0,0 +1,62 @@
+"""Unit tests for the near-duplicate question cache."""
+
+import time
+
+from question_cache import NearDuplicateIndex, normalize_question
+
+
+def test_normalize_keeps_question_words():
+    assert "how" in normalize_question("How can a runner steal home plate?")
+    assert "when" in normalize_question("When can a runner steal home plate?")
+    assert normalize_question("What's a balk?") == normalize_question("what is a balk")
+
+
+def test_paraphrase_matches():
+    index = NearDuplicateIndex()
+    index.insert("How does overtime work in the NFL playoffs?", "answer")
+    match = index.lookup("How does overtime work in NFL playoffs")
+    assert match is not None
+    assert match["answer"] == "answer"
+    assert match["similarity"] >= index.threshold
+
+
+def test_different_question_word_does_not_match():
+    index = NearDuplicateIndex()
+    index.insert("When can a runner steal home plate?", "timing")
+    index.insert("What is a balk?", "definition")
+    assert index.lookup("How can a runner steal home plate?") is None
+    assert index.lookup("When is it a balk?") is None
+    assert index.stats()["hits"] == 0
+
+
+def test_lru_eviction():
+    index = NearDuplicateIndex(max_entries=2)
+    index.insert("What is a balk?", "1")
+    index.insert("What is the infield fly rule?", "2")
+    assert index.lookup("What is a balk?") is not None  # now most recently used
+    index.insert("How long is an NBA quarter?", "3")
+    assert len(index) == 2
+    assert index.lookup("What is the infield fly rule?") is None
+    assert index.lookup("What is a balk?") is not None
+    assert index.stats()["evictions"] == 1
+
+
+def test_ttl_expires_entries(monkeypatch):
+    index = NearDuplicateIndex(ttl_s=60)
+    index.insert("What is a balk?", "definition")
+    assert index.lookup("What is a balk?") is not None
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert index.lookup("What is a balk?") is None
+    assert len(index) == 0
+    assert index.stats()["expirations"] == 1
+
+
+def test_audit_log_records_hits():
+    index = NearDuplicateIndex(audit_size=1)
+    index.insert("What is a balk?", "definition")
+    index.lookup("what's a balk")
+    index.lookup("What is a balk")
+    audit = index.audit_log()
+    assert len(audit) == 1
+    assert audit[0]["query"] == "What is a balk"
@@ -0,0 +1,66 @@
+"""Unit tests for the background request log writer and reader."""
+
+import gzip
+import json
+import os
+
+from request_log import RequestLogWriter, read_request_log
+
+
+def test_records_are_written_and_read_back(tmp_path):
+    path = str(tmp_path / "logs" / "requests.jsonl")
+    writer = RequestLogWriter(path, flush_interval=0.01)
+    for i in range(5):
+        assert writer.log({"i": i})
+    writer.close()
+
+    records = list(read_request_log(path))
+    assert [r["i"] for r in records] == list(range(5))
+    assert all("timestamp" in r for r in records)
+    assert writer.written == 5
+    assert writer.dropped == 0
+
+
+def test_rotation_compresses_and_keeps_order(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    # One record per batch and a tiny size limit, so every write rotates
+    writer = RequestLogWriter(path, max_bytes=1, backup_count=3, batch_size=1, flush_interval=0.01)
+    for i in range(5):
+        writer.log({"i": i})
+    writer.close()
+
+    assert not os.path.exists(path)
+    assert os.path.exists(f"{path}.3.gz")
+    assert not os.path.exists(f"{path}.4.gz")  # older backups are dropped
+    with gzip.open(f"{path}.1.gz", "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["i"] == 4
+    assert [r["i"] for r in read_request_log(path)] == [2, 3, 4]
+
+
+def test_overflow_drops_instead_of_blocking(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    writer = RequestLogWriter(path, queue_size=2)
+    writer.close()  # stop the consumer so the queue fills up
+
+    assert writer.log({"i": 0})
+    assert writer.log({"i": 1})
+    assert not writer.log({"i": 2})
+    assert writer.dropped == 1
+
+
+def test_read_missing_log_is_empty(tmp_path):
+    assert list(read_request_log(str(tmp_path / "missing.jsonl"))) == []
+
+
+def test_reader_skips_torn_and_corrupt_lines(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"i": 0}\n{"i": 1}\nnot json\n{"i": 2, "tor')
+    with gzip.open(f"{path}.1.gz", "wb") as f:
+        f.write(b'{"i": -1}\n')
+    with open(f"{path}.2.gz", "wb") as f:
+        f.write(b"not gzip")
+
+    stats = {}
+    assert [r["i"] for r in read_request_log(path, stats)] == [-1, 0, 1]
+    assert stats["skipped"] == 3
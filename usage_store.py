@@ -0,0 +1,84 @@
+"""
+Per-session and per-user payload and token accounting.
+
+Each endpoint call reports request/response bytes and input/output tokens
+(from the endpoint's usage fields when present, estimated otherwise). This
+store sums them per session and per user so the most expensive
+conversations can be found. Memory is bounded: the least recently active
+sessions and users are evicted first.
+"""
+
+import threading
+from collections import OrderedDict
+
+USAGE_FIELDS = ("calls", "request_bytes", "response_bytes", "input_tokens", "output_tokens")
+
+
+def _empty_totals() -> dict:
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+class UsageStore:
+    """Bounded in-memory usage totals keyed by session id and by user id."""
+
+    def __init__(self, max_sessions: int = 1000, max_users: int = 1000):
+        self.max_sessions = max_sessions
+        self.max_users = max_users
+        self._sessions = OrderedDict()
+        self._users = OrderedDict()
+        self._totals = _empty_totals()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _add(table: OrderedDict, key, usage: dict, limit: int) -> None:
+        totals = table.pop(key, None) or _empty_totals()
+        totals["calls"] += 1
+        for field in USAGE_FIELDS[1:]:
+            totals[field] += usage.get(field) or 0
+        table[key] = totals  # re-insert as most recently active
+        while len(table) > limit:
+            table.popitem(last=False)
+
+    def record(self, usage: dict, session_id: str = None, user_id: str = None) -> None:
+        """Add one call's usage to its session, its user and the overall totals."""
+        with self._lock:
+            self._totals["calls"] += 1
+            for field in USAGE_FIELDS[1:]:
+                self._totals[field] += usage.get(field) or 0
+            if session_id:
+                self._add(self._sessions, session_id, usage, self.max_sessions)
+            if user_id:
+                self._add(self._users, user_id, usage, self.max_users)
+
+    def session(self, session_id: str) -> dict:
+        with self._lock:
+            return dict(self._sessions.get(session_id) or _empty_totals())
+
+    def user(self, user_id: str) -> dict:
+        with self._lock:
+            return dict(self._users.get(user_id) or _empty_totals())
+
+    def top_sessions(self, n: int = 10, by: str = "input_tokens") -> list:
+        """Return the ``n`` sessions with the highest ``by`` total as (session_id, totals)."""
+        with self._lock:
+            ranked = sorted(self._sessions.items(), key=lambda item: item[1][by], reverse=True)
+            return [(key, dict(totals)) for key, totals in ranked[:n]]
+
+    def top_users(self, n: int = 10, by: str = "input_tokens") -> list:
+        """Return the ``n`` users with the highest ``by`` total as (user_id, totals)."""
+        with self._lock:
+            ranked = sorted(self._users.items(), key=lambda item: item[1][by], reverse=True)
+            return [(key, dict(totals)) for key, totals in ranked[:n]]
+
+    def snapshot(self, n: int = 10) -> dict:
+        """Export overall totals and the most expensive sessions and users."""
+        with self._lock:
+            totals = dict(self._totals)
+        return {
+            "totals": totals,
+            "top_sessions": self.top_sessions(n),
+            "top_users": self.top_users(n),
+        }
+
+
+usage_store = UsageStore()